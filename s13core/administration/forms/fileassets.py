@@ -8,7 +8,17 @@ class FileAssetForm(forms.ModelForm):
         model = FileAsset
         exclude = ['date_edit', 'date_made', 'extension']
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, upload_errors=None, **kwargs):
         super(FileAssetForm, self).__init__(*args, **kwargs)
+        # Uploads rejected by the upload handler; see StreamingUploadMixin.
+        self.upload_errors = upload_errors or {}
         if self.instance.pk is None:
             self.fields['media_file'].required = True
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for field, message in self.upload_errors.items():
+            # Replaces "This field is required."
+            self.errors.pop(field, None)
+            self.add_error(field, message)
+        return cleaned_data
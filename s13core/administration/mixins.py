@@ -2,6 +2,11 @@ from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.csrf import csrf_protect
+
+from s13core.content_management.uploads import StreamingUploadHandler
 
 
 class S13UserRequiredMixin(LoginRequiredMixin):
@@ -61,3 +66,24 @@ class GenericCRUDMixin(S13UserRequiredMixin):
     def get_success_url(self):
         messages.success(self.request, self.success_message)
         return self.success_url
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class StreamingUploadMixin:
+    '''Streams the uploaded files of logged-in users into the storage of
+    the model's @upload_field; see content_management.uploads.
+
+    Upload handlers can only be changed before the request body is read, and
+    CsrfViewMiddleware reads it, so the CSRF check is done here instead.
+    '''
+    def dispatch(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            storage = self.model._meta.get_field(self.upload_field).storage
+            request.upload_handlers.insert(
+                0, StreamingUploadHandler(request, storage))
+        return csrf_protect(super().dispatch)(request, *args, **kwargs)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['upload_errors'] = getattr(self.request, 'upload_errors', {})
+        return kwargs
@@ -0,0 +1,149 @@
+'''Website statistics for the administration dashboard.
+
+The statistics are computed with a few aggregate queries and kept in the
+Django cache as a snapshot. A snapshot made before the last content change,
+or more than DASHBOARD_STATS_MAX_AGE seconds (3600) ago, is still shown
+while a background thread computes a new one.
+'''
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+from django.db.models import Q
+from django.db.models import Sum
+
+from s13core.caching import get_version
+from s13core.content_management.models import Article
+from s13core.content_management.models import FileAsset
+from s13core.helpers import convert_bytes
+from s13core.helpers import get_now
+
+
+CACHE_KEY = 's13core:dashboard-stats'
+LOCK_KEY = 's13core:dashboard-stats-lock'
+
+
+def compute_stats():
+    '''Computes the statistics. Returns a dictionary.'''
+
+    started = time.perf_counter()
+    s = {}
+    # Article statistics.
+    counts = Article.objects.exclude(parent=None).aggregate(
+        total=Count('pk'), draft=Count('pk', filter=Q(is_public=False)))
+    s['articles_count'] = counts['total']
+    s['articles_draft'] = counts['draft']
+    s['articles_public'] = s['articles_count'] - s['articles_draft']
+    descendants = dict(
+        Article.objects.exclude(section=None).order_by().values('section')
+        .annotate(count=Count('pk')).values_list('section', 'count'))
+    s['sections'] = []
+    for section in Article.objects.filter(parent=None).only(
+            'pk', 'title').order_by('-is_homepage', 'weight'):
+        num_descendants = descendants.get(section.pk, 0)
+        if num_descendants:
+            pct_all = int((num_descendants / s['articles_count']) * 100)
+        else:
+            pct_all = 0
+        s['sections'].append({
+            'title': section.title,
+            'num_descendants': num_descendants,
+            'pct_all': pct_all
+        })
+    s['sections_count'] = len(s['sections'])
+
+    # FileAsset statistics, from what was found on disk when the files were
+    # last verified.
+    s['asset_types'] = {'unknown': {'count': 0, 'size': 0}}
+    assets = FileAsset.objects.order_by()
+    counts = assets.aggregate(
+        broken=Count('pk', filter=Q(
+            file_exists=False, verified_at__isnull=False)),
+        unverified=Count('pk', filter=Q(verified_at=None)))
+    s['assets_broken'] = counts['broken']
+    s['assets_unverified'] = counts['unverified']
+    s['assets_total'] = 0
+    s['assets_total_size'] = 0
+    for row in assets.values('extension').annotate(
+            count=Count('pk'),
+            size=Sum('size_bytes', filter=Q(file_exists=True))):
+        ext = row['extension'] if row['extension'] else 'unknown'
+        if ext not in s['asset_types']:
+            s['asset_types'][ext] = {'count': 0, 'size': 0}
+        s['asset_types'][ext]['count'] += row['count']
+        s['asset_types'][ext]['size'] += row['size'] or 0
+        s['assets_total'] += row['count']
+        s['assets_total_size'] += row['size'] or 0
+    for k, v in s['asset_types'].items():
+        if s['assets_total']:
+            v['pct_all'] = int((v['count'] / s['assets_total']) * 100)
+        else:
+            v['pct_all'] = '-'
+        if s['assets_total_size']:
+            v['pct_size'] = int((v['size'] / s['assets_total_size']) * 100)
+        else:
+            v['pct_size'] = '-'
+        v['size'] = '{0:.2f}MB'.format(convert_bytes(v['size'], 'mb'))
+    # Finally.
+    s['assets_total_size'] = '{0:.2f}MB'.format(
+        convert_bytes(s['assets_total_size'], 'mb'))
+    s['computed_at'] = get_now()
+    s['computation_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return s
+
+
+def get_max_age():
+    return getattr(settings, 'DASHBOARD_STATS_MAX_AGE', 3600)
+
+
+def get_stats():
+    '''Returns the latest snapshot of the statistics, with an is_stale key
+    that is True while a newer one is being computed. Computes the first
+    snapshot right away.
+    '''
+    snapshot = cache.get(CACHE_KEY)
+    if snapshot is None:
+        return refresh()
+    is_stale = snapshot['version'] != get_version('content') or \
+        (get_now() - snapshot['stats']['computed_at']).total_seconds() > \
+        get_max_age()
+    if is_stale:
+        if getattr(settings, 'DASHBOARD_STATS_BACKGROUND', True):
+            refresh_in_background()
+        else:
+            return refresh()
+    return dict(snapshot['stats'], is_stale=is_stale)
+
+
+def refresh():
+    '''Computes and stores a new snapshot. Returns its statistics.'''
+
+    # Take the version first so that changes made while computing make the
+    # snapshot stale.
+    version = get_version('content')
+    stats = compute_stats()
+    cache.set(CACHE_KEY, {'version': version, 'stats': stats}, None)
+    return dict(stats, is_stale=False)
+
+
+def refresh_in_background():
+    '''Starts a thread that refreshes the snapshot, unless one is already
+    running in any process.
+    '''
+    if not cache.add(LOCK_KEY, True, 600):
+        return False
+    thread = threading.Thread(target=_refresh, daemon=True)
+    thread.start()
+    return True
+
+
+def _refresh():
+    try:
+        refresh()
+    finally:
+        cache.delete(LOCK_KEY)
+        # The thread has its own database connections.
+        connections.close_all()
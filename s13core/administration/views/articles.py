@@ -1,5 +1,6 @@
 from django.contrib import messages
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ValidationError
 from django.db.models import Q
 from django.urls import reverse_lazy
 from django.utils.http import urlencode
@@ -163,7 +164,11 @@ class ArticleAssociate(S13UserRequiredMixin, RedirectView):
         if mode == 'children':
             if is_add:
                 selected_article.parent = base_article
-                selected_article.save()
+                try:
+                    selected_article.save()
+                except ValidationError as e:
+                    messages.error(self.request, e.message)
+                    return reverse_lazy('s13admin:detail_article', args=args)
                 message = 'Article added to child articles.'
             else:
                 selected_article.parent = None
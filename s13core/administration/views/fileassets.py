@@ -10,6 +10,7 @@ from s13core.content_management.models import FileAsset
 
 from ..forms.fileassets import FileAssetForm
 from ..mixins import GenericCRUDMixin
+from ..mixins import StreamingUploadMixin
 
 
 class FileAssetCRUDMixin(GenericCRUDMixin):
@@ -20,6 +21,7 @@ class FileAssetCRUDMixin(GenericCRUDMixin):
     success_url = reverse_lazy('s13admin:fileassets')
     context_sidebars = ['nav_fileassets']
     paginate_by = 8
+    upload_field = 'media_file'
 
 
 class FileAssetsList(FileAssetCRUDMixin, ListView):
@@ -67,7 +69,7 @@ class FileAssetsList(FileAssetCRUDMixin, ListView):
             return FileAsset.objects.all()
 
 
-class FileAssetCreate(FileAssetCRUDMixin, CreateView):
+class FileAssetCreate(StreamingUploadMixin, FileAssetCRUDMixin, CreateView):
     template_name = 'admin/forms/update_fileasset.html'
     ui_title = 'Create New FileAsset'
     ui_description = 'Upload a media file and create a new FileAsset object.'
@@ -83,7 +85,7 @@ class FileAssetDelete(FileAssetCRUDMixin, DeleteView):
     context_delete_text = 'Delete FileAsset'
 
 
-class FileAssetUpdate(FileAssetCRUDMixin, UpdateView):
+class FileAssetUpdate(StreamingUploadMixin, FileAssetCRUDMixin, UpdateView):
     template_name = 'admin/forms/update_fileasset.html'
     ui_title = 'Update FileAsset'
     ui_description = 'Upload a new media file and/or update an existing ' + \
@@ -11,14 +11,11 @@ from django.views.generic import RedirectView
 from django.views.generic import TemplateView
 from django.views.generic.edit import UpdateView
 
-from s13core.content_management.models import Article
-from s13core.content_management.models import FileAsset
-from s13core.helpers import convert_bytes
-
 from ..forms.home import ChangeInformationForm
 from ..forms.home import ChangePasswordForm
 from ..forms.home import LoginForm
 from ..mixins import S13UserRequiredMixin
+from ..stats import get_stats
 
 
 class Dashboard(S13UserRequiredMixin, TemplateView):
@@ -35,58 +32,7 @@ class Dashboard(S13UserRequiredMixin, TemplateView):
         return context
 
     def _get_stats(self):
-        s = {}
-        # Article statistics.
-        articles = Article.objects.all()
-        s['articles_count'] = articles.exclude(parent=None).count()
-        s['articles_draft'] = articles.filter(
-            is_public=False).exclude(parent=None).count()
-        s['articles_public'] = s['articles_count'] - s['articles_draft']
-        s['sections'] = []
-        for section in Article.objects.get_sections():
-            num_descendants = len(section.get_progeny())
-            if num_descendants:
-                pct_all = int((num_descendants / s['articles_count']) * 100)
-            else:
-                pct_all = 0
-            s['sections'].append({
-                'title': section.title,
-                'num_descendants': num_descendants,
-                'pct_all': pct_all
-            })
-        s['sections_count'] = len(s['sections'])
-
-        # FileAsset statistics.
-        s['asset_types'] = {'unknown': {'count': 0, 'size': 0}}
-        s['assets_broken'] = 0
-        s['assets_total'] = 0
-        s['assets_total_size'] = 0
-        for fa in FileAsset.objects.all():
-            s['assets_total'] += 1
-            ext = fa.extension if fa.extension else 'unknown'
-            if ext not in s['asset_types']:
-                s['asset_types'][ext] = {'count': 0, 'size': 0}
-            s['asset_types'][ext]['count'] += 1
-            if fa.on_disk:
-                size = fa.size
-                s['asset_types'][ext]['size'] += size
-                s['assets_total_size'] += size
-            else:
-                s['assets_broken'] += 1
-        for k, v in s['asset_types'].items():
-            if s['assets_total']:
-                v['pct_all'] = int((v['count'] / s['assets_total']) * 100)
-            else:
-                v['pct_all'] = '-'
-            if s['assets_total_size']:
-                v['pct_size'] = int((v['size'] / s['assets_total_size']) * 100)
-            else:
-                v['pct_size'] = '-'
-            v['size'] = '{0:.2f}MB'.format(convert_bytes(v['size'], 'mb'))
-        # Finally.
-        s['assets_total_size'] = '{0:.2f}MB'.format(
-            convert_bytes(s['assets_total_size'], 'mb'))
-        return s
+        return get_stats()
 
 
 class UpdatePassword(S13UserRequiredMixin, UpdateView):
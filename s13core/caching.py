@@ -0,0 +1,120 @@
+'''Caching utilities shared by s13core submodules.'''
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from datetime import timezone
+
+from django.core.cache import cache
+
+
+class LRUCache:
+    '''A thread-safe, size-bounded mapping that evicts the least recently
+    used entry when full. Keeps hit and miss counters for inspection.
+
+    Arguments:
+        max_size - maximum number of entries to keep; zero disables caching
+    '''
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        '''Empties the cache and resets the counters.'''
+
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key, default=None):
+        '''Returns the value stored under @key and marks it as recently used;
+        returns @default if there is no such key.
+        '''
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_or_set(self, key, make_value):
+        '''Returns the value stored under @key; calls @make_value and stores
+        its result if there is no such key.
+        '''
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            # Build the value outside the lock; a concurrent miss on the same
+            # key simply builds it twice.
+            value = make_value()
+            self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        '''Stores @value under @key, evicting old entries if necessary.'''
+
+        if self.max_size < 1:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    @property
+    def stats(self):
+        '''Returns a dictionary of the cache's counters and size.'''
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'max_size': self.max_size,
+        }
+
+
+def bump_version(name):
+    '''Replaces the version stamp for @name so that anything cached against
+    the previous stamp is no longer used.
+    '''
+    cache.set(_version_key(name), _make_version(), None)
+
+
+def get_version(name):
+    '''Returns the current version stamp for @name. Version stamps live in
+    Django's cache so that every process sharing the cache sees them.
+    '''
+    return cache.get_or_set(_version_key(name), _make_version, None)
+
+
+def get_version_date(name):
+    '''Returns the time @name was last changed, according to its version
+    stamp, as a timezone-aware datetime.
+    '''
+    return datetime.fromtimestamp(
+        int(get_version(name)) / 1e9, timezone.utc)
+
+
+def _make_version():
+    # Version stamps are the time they were made, in nanoseconds. A stamp
+    # that has been evicted from the cache comes back as the current time,
+    # which invalidates whatever was cached against it.
+    return str(time.time_ns())
+
+
+def _version_key(name):
+    return 's13core:version:{}'.format(name)
@@ -0,0 +1,55 @@
+'''Reads the size, modification time, and checksum of uploaded files.
+
+These functions touch only the filesystem, never the database, so that they
+can run in worker threads; see the s13verifyassets command.
+'''
+import hashlib
+import os
+from datetime import datetime
+from datetime import timezone
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    '''Returns the hex SHA-256 digest of the file at @path.'''
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_file_info(path, size_bytes=None, mtime=None, sha256='', force=False):
+    '''Returns a dictionary of FileAsset field values for the file at @path:
+    file_exists, size_bytes, mtime, and sha256.
+
+    The known @size_bytes, @mtime, and @sha256 of the file are given so that
+    the file is hashed again only if its size or modification time changed,
+    or if @force is True. An @mtime of None with a @sha256 means that the
+    checksum was computed as the file was written, like for streamed
+    uploads; the file is then hashed again only if its size changed.
+    '''
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        stat = None
+    if stat is None:
+        return {
+            'file_exists': False,
+            'size_bytes': None,
+            'mtime': None,
+            'sha256': '',
+        }
+    new_mtime = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+    if force or not sha256 or stat.st_size != size_bytes or \
+            (mtime is not None and new_mtime != mtime):
+        sha256 = hash_file(path)
+    return {
+        'file_exists': True,
+        'size_bytes': stat.st_size,
+        'mtime': new_mtime,
+        'sha256': sha256,
+    }
@@ -0,0 +1,179 @@
+import logging
+import random
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.urls import Resolver404
+from django.urls import resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from s13core import timing
+
+from . import pagecache
+from . import querybudget
+
+
+logger = logging.getLogger('s13core.timing')
+
+
+class PageCacheMiddleware:
+    '''Serves anonymous GET requests for pages in the s13cms namespace from
+    the page cache, and stores the pages rendered for them. See pagecache.
+    '''
+    namespace = 's13cms'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.is_cacheable(request):
+            return self.get_response(request)
+        cache = pagecache.get_cache()
+        key = pagecache.make_key(request)
+        cached = cache.get(key)
+        if cached and 'headers' in cached:
+            return self.make_response(request, cached)
+        response = self.get_response(request)
+        if self.is_storable(response):
+            # All the headers are kept since the middleware that comes after
+            # this one, like XFrameOptionsMiddleware, does not see hits.
+            cache.set(key, {
+                'content': response.content,
+                'headers': list(response.headers.items()),
+            }, pagecache.get_timeout())
+        return response
+
+    def is_cacheable(self, request):
+        '''Evaluates whether the request may be answered from the cache.'''
+
+        if not pagecache.is_enabled() or request.method != 'GET':
+            return False
+        # Visitors with a session or messages may see pages that differ.
+        if settings.SESSION_COOKIE_NAME in request.COOKIES or \
+                'messages' in request.COOKIES:
+            return False
+        if request.user.is_authenticated:
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return match.namespace == self.namespace
+
+    def is_storable(self, response):
+        return response.status_code == 200 and \
+            not response.streaming and \
+            not response.cookies and \
+            not response.has_header('Vary')
+
+    def make_response(self, request, cached):
+        response = HttpResponse(cached['content'])
+        for header, value in cached['headers']:
+            response.headers[header] = value
+        # Let clients that have the page already revalidate against it.
+        not_modified = get_conditional_response(
+            request,
+            etag=response.headers.get('ETag'),
+            last_modified=parse_http_date_safe(
+                response.headers.get('Last-Modified', '')),
+            response=response
+        )
+        return not_modified or response
+
+
+class QueryBudgetMiddleware:
+    '''When DEBUG and QUERY_BUDGET_CHECKS are True, raises
+    QueryBudgetExceeded if a view runs more database queries than its
+    query_budget attribute allows. Does nothing otherwise; QUERY_BUDGET_CHECKS
+    is False by default. The count includes queries run by the Jinja2 code
+    of article bodies, so use the middleware in development only. Put it
+    after AuthenticationMiddleware so that loading the user is counted too.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG or \
+                not getattr(settings, 'QUERY_BUDGET_CHECKS', False):
+            return self.get_response(request)
+        with querybudget.count_queries() as counter:
+            response = self.get_response(request)
+        view_class = getattr(request, 'query_budget_view', None)
+        if view_class:
+            querybudget.check(view_class, counter, request.path)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget_view = getattr(view_func, 'view_class', None)
+
+
+class TimingMiddleware:
+    '''Measures a sample of requests: the number and duration of database
+    queries, the time spent rendering Article bodies and templates, and the
+    total time. The measurements are sent back in a Server-Timing header and
+    logged to the "s13core.timing" logger, keyed on the URL name.
+
+    REQUEST_TIMING_SAMPLE_RATE sets the share of requests measured, from 0,
+    the default, to 1. Put the middleware first in MIDDLEWARE so that the
+    total covers the other middleware, including the page cache.
+    '''
+    # Server-Timing metric names and descriptions.
+    metrics = [
+        ('db', 'Database'),
+        ('body', 'Article bodies'),
+        ('template', 'Templates'),
+    ]
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = getattr(settings, 'REQUEST_TIMING_SAMPLE_RATE', 0)
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+        timings, token = timing.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        timing.QueryTimer(timings)))
+                response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        total = timings.elapsed
+        response.headers['Server-Timing'] = self.make_header(timings, total)
+        self.log(request, response, timings, total)
+        return response
+
+    def log(self, request, response, timings, total):
+        match = request.resolver_match
+        data = {
+            'url_name': match.view_name if match else None,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.counts.get('db', 0),
+            'total_ms': round(total * 1000, 1),
+        }
+        for name, description in self.metrics:
+            data['{}_ms'.format(name)] = round(
+                timings.durations.get(name, 0) * 1000, 1)
+        logger.info(
+            ' '.join('{}=%s'.format(x) for x in data),
+            *data.values(),
+            extra={'timing': data}
+        )
+
+    def make_header(self, timings, total):
+        metrics = []
+        for name, description in self.metrics:
+            if name in timings.durations:
+                if name == 'db':
+                    description = '{} ({} queries)'.format(
+                        description, timings.counts[name])
+                metrics.append('{};dur={:.1f};desc="{}"'.format(
+                    name, timings.durations[name] * 1000, description))
+        metrics.append('total;dur={:.1f}'.format(total * 1000))
+        return ', '.join(metrics)
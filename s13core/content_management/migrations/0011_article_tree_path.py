@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+def build_tree_paths(apps, schema_editor):
+    Article = apps.get_model('content_management', 'Article')
+    parents = dict(Article.objects.values_list('pk', 'parent_id'))
+    articles = []
+    for article in Article.objects.only('pk'):
+        pks = [article.pk]
+        parent = parents.get(article.pk)
+        # Guard against parent loops that may already be in the database.
+        while parent is not None and parent not in pks:
+            pks.insert(0, parent)
+            parent = parents.get(parent)
+        article.tree_path = ''.join('{}/'.format(pk) for pk in pks)
+        articles.append(article)
+    Article.objects.bulk_update(articles, ['tree_path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_management', '0010_auto_20211010_2123'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='tree_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_tree_paths, migrations.RunPython.noop),
+    ]
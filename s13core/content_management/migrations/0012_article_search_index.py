@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from s13core.content_management.search import search_index
+
+
+def create_search_index(apps, schema_editor):
+    if search_index.create(schema_editor):
+        Article = apps.get_model('content_management', 'Article')
+        search_index.rebuild(Article.objects.iterator())
+
+
+def drop_search_index(apps, schema_editor):
+    search_index.drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_management', '0011_article_tree_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
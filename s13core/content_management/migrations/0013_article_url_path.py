@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:02
+
+from django.db import migrations, models
+from django.urls import reverse
+
+
+def build_url_paths(apps, schema_editor):
+    Article = apps.get_model('content_management', 'Article')
+    sections = dict(
+        Article.objects.filter(parent=None).values_list('pk', 'slug'))
+    articles = []
+    for article in Article.objects.only(
+            'pk', 'slug', 'parent', 'is_homepage', 'tree_path'):
+        if article.is_homepage:
+            article.url_path = reverse('s13cms:homepage')
+        elif article.parent_id is None:
+            article.url_path = reverse('s13cms:section', args=[article.slug])
+        else:
+            pks = [int(x) for x in article.tree_path.split('/') if x]
+            section_slug = sections.get(pks[0]) if pks else None
+            if section_slug is None:
+                # Leave it to Article.make_url() to find the section.
+                continue
+            article.url_path = reverse(
+                's13cms:article', args=[section_slug, article.slug])
+        articles.append(article)
+    Article.objects.bulk_update(articles, ['url_path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_management', '0012_article_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='url_path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_url_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_sections(apps, schema_editor):
+    Article = apps.get_model('content_management', 'Article')
+    sections = set(
+        Article.objects.filter(parent=None).values_list('pk', flat=True))
+    articles = []
+    for article in Article.objects.exclude(parent=None).only(
+            'pk', 'tree_path'):
+        pks = [int(x) for x in article.tree_path.split('/') if x]
+        if pks and pks[0] in sections:
+            article.section_id = pks[0]
+            articles.append(article)
+    Article.objects.bulk_update(articles, ['section'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_management', '0013_article_url_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='section',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='section_articles', to='content_management.article'),
+        ),
+        migrations.RunPython(set_sections, migrations.RunPython.noop),
+    ]
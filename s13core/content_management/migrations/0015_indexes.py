@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_management', '0014_article_section'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['parent', 'weight'], name='article_children_weight'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['parent', 'date_edit'], name='article_children_edit'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['parent', 'title'], name='article_children_title'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['date_made'], name='article_public_made'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['date_edit'], name='article_public_edit'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_homepage', True)), fields=['is_homepage'], name='article_homepage'),
+        ),
+        migrations.AddIndex(
+            model_name='fileasset',
+            index=models.Index(fields=['extension'], name='fileasset_extension'),
+        ),
+    ]
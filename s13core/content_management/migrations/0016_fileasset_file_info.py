@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_management', '0015_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileasset',
+            name='file_exists',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fileasset',
+            name='mtime',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileasset',
+            name='sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='fileasset',
+            name='size_bytes',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileasset',
+            name='verified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
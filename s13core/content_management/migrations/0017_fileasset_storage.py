@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:00
+
+import s13core.content_management.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_management', '0016_fileasset_file_info'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fileasset',
+            name='media_file',
+            field=models.FileField(blank=True, default=None, storage=s13core.content_management.models.get_media_storage, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_management', '0017_fileasset_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileasset',
+            name='rendition_files',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -6,16 +6,44 @@ from django.core.files.storage import FileSystemStorage
 from django.contrib.auth.models import User
 from django.db import models
 from django.db.models import Q
+from django.db.models import Value
+from django.db.models.signals import m2m_changed
+from django.db.models.functions import Concat
+from django.db.models.functions import Substr
 from django.urls import reverse
-
-from jinja2 import Template
+from django.utils.functional import cached_property
 
 import s13core
 from s13core import helpers as h
+from s13core.caching import LRUCache
+from s13core.caching import bump_version
+from s13core.caching import get_version
+from s13core.jinja2env import compile_template
+from s13core.timing import timer
+
+from . import pagecache
+from .fileinfo import read_file_info
+from . import recent
+from . import renditions
+from .pagination import fetch_after
+from .pagination import parse_sort_key
+from .search import search_index
+from .storage import ContentAddressedStorage
 
 
 DATE_FORMAT = '%A, %d %B %Y - %H:%M'
 
+# The map made by ArticleManager.get_slug_map, keyed on the content version.
+slug_maps = LRUCache(1)
+
+
+def tree_path_filter(tree_path):
+    '''Returns a filter for Articles whose tree path starts with @tree_path.
+    Uses a range instead of LIKE so that the index on tree_path is usable;
+    paths contain only digits and slashes, and "0" comes right after "/".
+    '''
+    return Q(tree_path__gte=tree_path, tree_path__lt=tree_path[:-1] + '0')
+
 
 class ArticleManager(models.Manager):
     def get_homepage(self):
@@ -29,51 +57,64 @@ class ArticleManager(models.Manager):
         '''
         return self._select_by_filter(slug=section_slug, parent=None)
 
+    def get_section_map(self):
+        '''Returns a dictionary of the website's sections keyed on their pks,
+        for resolving many article URLs without walking their ancestry.
+        '''
+        return self.filter(parent=None).only(
+            'pk', 'slug', 'is_public', 'is_homepage', 'tree_path',
+            'url_path').in_bulk()
+
     def get_sections(self):
         '''Selects and sorts the website's sections by weight.'''
 
-        sections = []
-        selection = self._select_by_filter(return_all=True, parent=None)
-        if not selection:
-            return sections
-        for section in selection.order_by('-is_homepage', 'weight'):
-            section.pre_render()
-            sections.append(section)
-        return sections
+        # Bodies are rendered on demand through Article.rendered_body.
+        return list(Article.objects.filter(parent=None)
+                    .order_by('-is_homepage', 'weight'))
 
     def get_article(self, section_slug, article_slug):
         '''Selects an Article; validates that it does indeed fall under a
         section with the given slug. Returns both the section and the Article.
         '''
-        article = self._select_by_filter(slug=article_slug)
-        if not article:
-            return None, None
-        if article.parent is None:
+        filters = {'slug': article_slug}
+        if getattr(settings, 'ARTICLE_SLUG_MAP', False):
+            # Reject unknown slugs and mismatched sections without a query.
+            entry = self.get_slug_map().get(article_slug)
+            if entry is None or entry[1] != section_slug:
+                return None, None
+            filters = {'pk': entry[0]}
+        article = self.select_related('section', 'parent')\
+            .filter(parent__isnull=False, **filters).first()
+        if article is None:
             return None, None
-        section = article.get_section()
-        if section.slug != section_slug:
+        if article.section_id:
+            section = article.section
+        else:
+            section = article.get_section()
+        if section is None or section.slug != section_slug:
             return None, None
         return section, article
 
+    def get_slug_map(self):
+        '''Returns a dictionary of (pk, section slug, is_public) tuples keyed
+        on the slugs of all Articles; sections have no section slug. The map
+        is kept in each process until an Article or FileAsset is changed.
+        '''
+        return slug_maps.get_or_set(get_version('content'), lambda: {
+            x[0]: x[1:] for x in self.values_list(
+                'slug', 'pk', 'section__slug', 'is_public').iterator()
+        })
+
     def search(self, term):
-        '''Returns a list of articles that have @term in their title, slug,
-        or keywords. Website sections and private articles are excluded.
-        Results are ordered by date of last modification, latest first.
+        '''Returns a list of articles that have the words in @term in their
+        title, keywords, description, or body. Website sections and private
+        articles are excluded. Results are ordered by relevance, best first,
+        and carry search_rank and search_snippet attributes.
         '''
         # We require at least 3 characters.
         if len(term) < 3:
             return []  # We need to return an iterable, not None.
-        return Article.objects.filter(
-            Q(title__icontains=term) |
-            Q(slug__icontains=term) |
-            Q(keywords__icontains=term)
-        ).exclude(
-            is_public=False
-        ).exclude(
-            parent=None
-        ).order_by(
-            '-date_edit'
-        )
+        return search_index.search(Article, term)
 
     def _select_by_filter(self, **kwargs):
         '''Multi-model selector for finding sub-classed Articles.'''
@@ -89,7 +130,6 @@ class ArticleManager(models.Manager):
         if return_all:
             return s
         else:
-            s[0].pre_render()
             return s[0]
 
 
@@ -235,6 +275,73 @@ class Article(models.Model):
         help_text='Use this field as an alternate sorting value.'
     )
 
+    # Tree index: the pks of the Article's ancestors and its own, oldest
+    # first, like "1/5/12/". Maintained by save() and delete().
+    tree_path = models.CharField(
+        max_length=255,
+        default='',
+        blank=True,
+        editable=False,
+        db_index=True
+    )
+    # The Article's oldest ancestor; None for sections. Maintained by save()
+    # and delete() along with the tree index.
+    section = models.ForeignKey(
+        'Article',
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='section_articles',
+        on_delete=models.SET_NULL
+    )
+    # The Article's URL path, as made by make_url. Maintained by save() and
+    # delete().
+    url_path = models.CharField(
+        max_length=255,
+        default='',
+        blank=True,
+        editable=False
+    )
+
+    class Meta:
+        # Indexes for the filters and orderings that the views use: public
+        # children by each sort key, the latest public articles, and the
+        # homepage. Django filters booleans as bare columns, like WHERE
+        # "is_public", which SQLite can match against a partial index but
+        # not against an indexed column.
+        indexes = [
+            models.Index(
+                fields=['parent', 'weight'],
+                condition=Q(is_public=True),
+                name='article_children_weight'
+            ),
+            models.Index(
+                fields=['parent', 'date_edit'],
+                condition=Q(is_public=True),
+                name='article_children_edit'
+            ),
+            models.Index(
+                fields=['parent', 'title'],
+                condition=Q(is_public=True),
+                name='article_children_title'
+            ),
+            models.Index(
+                fields=['date_made'],
+                condition=Q(is_public=True),
+                name='article_public_made'
+            ),
+            models.Index(
+                fields=['date_edit'],
+                condition=Q(is_public=True),
+                name='article_public_edit'
+            ),
+            models.Index(
+                fields=['is_homepage'],
+                condition=Q(is_homepage=True),
+                name='article_homepage'
+            ),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -251,6 +358,13 @@ class Article(models.Model):
 
         if ancestors is None:
             ancestors = []
+        pks = self._get_ancestor_pks()
+        if pks:
+            found = Article.objects.in_bulk(pks)
+            if len(found) == len(pks):
+                return ancestors + [found[pk] for pk in reversed(pks)]
+        # The Article has not been saved or its tree index is out of date;
+        # walk through the parents instead.
         if self.parent:
             ancestors.append(self.parent)
             return self.parent.get_ancestry(ancestors)
@@ -281,32 +395,49 @@ class Article(models.Model):
 
     def get_previous_and_next(self):
         '''Returns the previous and next article based on the parent
-        ordering.
+        ordering. Articles that sort equally are ordered by pk.
         '''
-        previous = None
-        next = None
-        siblings = list(self.get_siblings())
-        index = siblings.index(self)
-        if index > 0:
-            previous = siblings[index - 1]
-        if index < len(siblings) - 1:
-            next = siblings[index + 1]
-        return previous, next
+        sorter = self.parent.sort_children if self.parent else 'weight'
+        field, descending = parse_sort_key(Article, sorter)
+        value = getattr(self, field) if field != 'pk' else self.pk
+        siblings = self.get_siblings()
+        neighbours = []
+        # Look for the first sibling in the reversed order, then in the
+        # parent's order, starting from this article.
+        for backwards in [True, False]:
+            neighbours += fetch_after(
+                siblings, field, descending != backwards, value, self.pk, 1
+            ) or [None]
+        return neighbours[0], neighbours[1]
 
     def get_progeny(self):
         '''Returns a list of an Article's descendants.'''
 
-        # This might be expensive; we leave ourselves open to other options.
-        descendants = [x for x in Article.objects.all()
-                       if x.get_section() == self]
-        return descendants
+        if not self.tree_path:
+            return Article.objects.none()
+        return Article.objects.filter(
+            tree_path_filter(self.tree_path)).exclude(pk=self.pk)
 
     def get_section(self):
         '''Returns the Article's oldest ancestor, if any.'''
 
+        if self.section_id:
+            return self.section
+        section_pk = self.get_section_pk()
+        if section_pk:
+            section = Article.objects.filter(pk=section_pk).first()
+            if section:
+                return section
         ancestry = self.get_ancestry()
         return ancestry[-1] if ancestry else None
 
+    def get_section_pk(self):
+        '''Returns the pk of the Article's oldest ancestor according to the
+        tree index; None if there is none or the index cannot be trusted.
+        '''
+        pks = self._get_ancestor_pks()
+        return pks[0] if pks else None
+
     def get_siblings(self, exclude_private=True):
         '''Returns a list of Articles whose parent matches the current's parent.
         The list returned includes the current article.
@@ -319,33 +450,96 @@ class Article(models.Model):
             filters['is_public'] = True
         return Article.objects.filter(**filters).order_by(sorter)
 
-    def make_url(self):
-        '''Generates a URL that is appropriate for this article.'''
+    def make_url(self, section_map=None):
+        '''Generates a URL that is appropriate for this article.
 
+        Arguments:
+            section_map - optional, a dictionary made by
+                Article.objects.get_section_map(); saves the queries needed
+                to find the article's section when making many URLs
+
+        Saved Articles return their stored url_path.
+        '''
+        if self.url_path:
+            return self.url_path
         if self.is_homepage:
             return reverse('s13cms:homepage')
         # Between a section and an article.
-        if self.parent is None:
+        if self.parent_id is None and self.parent is None:
             return reverse('s13cms:section', args=[self.slug])
-        else:
-            return reverse(
-                's13cms:article',
-                args=[self.get_section().slug, self.slug]
-            )
+        section = None
+        if section_map is not None:
+            section = section_map.get(self.get_section_pk())
+        if section is None:
+            section = self.get_section()
+        return reverse('s13cms:article', args=[section.slug, self.slug])
 
     def pre_render(self):
-        '''Pre-render the body.'''
+        '''Pre-render the body; replaces the body with rendered_body. The
+        public views do this for the article they show, so that templates may
+        use either; calling it again does nothing.
+        '''
+        self.body = self.rendered_body
 
-        if self.body:
-            self.body = Template(self.body).render(s13=s13core, article=self)
-        else:
-            self.body = ''
+    @cached_property
+    def rendered_body(self):
+        '''The body, rendered as a Jinja2 template on first access.'''
+
+        if not self.body:
+            return ''
+        with timer('body'):
+            return compile_template(self.body).render(
+                s13=s13core, article=self)
+
+    def delete(self, *args, **kwargs):
+        '''Children of a deleted Article become sections; move them and their
+        descendants in the tree index.
+        '''
+        children = list(Article.objects.filter(parent=self))
+        search_index.remove(self.pk)
+        result = super().delete(*args, **kwargs)
+        for child in children:
+            child.parent = None
+            child._update_tree_path(child.tree_path, '')
+            child._update_url_paths(child.slug, True)
+            child.section = None
+            Article.objects.filter(pk=child.pk).update(section=None)
+            child._update_progeny_sections()
+        bump_version('content')
+        pagecache.invalidate_all()
+        recent.invalidate()
+        return result
 
     def save(self, *args, **kwargs):
+        stored_path = ''
+        parent_path = ''
+        # Sections appear in every page's navigation; moved articles change
+        # the URLs shown in other pages.
+        is_structural = self.parent_id is None
+        # Whether the URLs of the Article's descendants may change.
+        is_moved = False
+        is_homepage_changed = self.is_homepage
+        # Pages that linked to the Article as their neighbour before a new
+        # sort value moved it elsewhere in its parent's order.
+        old_neighbour_paths = []
         if self.pk:
             a = Article.objects.get(pk=self.pk)
             if a == self.parent:
                 raise ValidationError('Article cannot be its own parent.')
+            stored_path = a.tree_path
+            is_structural = is_structural or a.parent_id is None or \
+                a.parent_id != self.parent_id or a.slug != self.slug or \
+                a.is_homepage != self.is_homepage
+            is_moved = a.parent_id != self.parent_id or \
+                (a.parent_id is None and a.slug != self.slug)
+            is_homepage_changed = a.is_homepage != self.is_homepage
+            if not is_structural and pagecache.is_enabled():
+                old_neighbour_paths = pagecache.get_neighbour_paths(a)
+        if self.parent_id:
+            parent_path = Article.objects.values_list(
+                'tree_path', flat=True).get(pk=self.parent_id)
+            if self.pk and str(self.pk) in parent_path.split('/'):
+                raise ValidationError('Article cannot be its own ancestor.')
         if not self.date_made:
             self.date_made = h.get_now()
         # Generate a slug based on the date if a slug was not given.
@@ -356,7 +550,104 @@ class Article(models.Model):
             for a in Article.objects.filter(is_homepage=True):
                 a.is_homepage = False
                 a.save()
+        section_slug = self.slug
+        self.section = None
+        if self.parent_id:
+            self.section_id, section_slug = self._find_section(parent_path)
+        self.url_path = self._make_url_path(section_slug)
         super().save(*args, **kwargs)
+        self._update_tree_path(stored_path, parent_path)
+        if is_moved:
+            self._update_url_paths(section_slug, True)
+            self._update_progeny_sections()
+        search_index.update(self)
+        bump_version('content')
+        if is_structural:
+            pagecache.invalidate_all()
+        else:
+            pagecache.invalidate_article(self, old_neighbour_paths)
+        # A new homepage, or new URLs for the descendants, change more than
+        # this Article's entry in the latest articles.
+        if is_homepage_changed or is_moved:
+            recent.invalidate()
+        else:
+            recent.update(self)
+
+    def _get_ancestor_pks(self):
+        '''Returns the pks of the Article's ancestors, oldest first, according
+        to the tree index; None if the index cannot be trusted.
+        '''
+        if not self.pk or not self.tree_path or self.parent_id is None:
+            return None
+        pks = [int(x) for x in self.tree_path.split('/') if x]
+        if len(pks) < 2 or pks[-1] != self.pk or pks[-2] != self.parent_id:
+            return None
+        return pks[:-1]
+
+    def _find_section(self, parent_path):
+        '''Returns the pk and slug of the section that the Article's parent,
+        whose tree path is @parent_path, falls under.
+        '''
+        pks = [int(x) for x in parent_path.split('/') if x]
+        if pks:
+            section = Article.objects.filter(pk=pks[0]).values_list(
+                'pk', 'slug').first()
+            if section is not None:
+                return section
+        section = self.parent.get_section() or self.parent
+        return section.pk, section.slug
+
+    def _make_url_path(self, section_slug):
+        '''Makes the URL path of the Article, given the slug of the section
+        that it falls under.
+        '''
+        if self.is_homepage:
+            return reverse('s13cms:homepage')
+        if self.parent_id is None:
+            return reverse('s13cms:section', args=[self.slug])
+        return reverse('s13cms:article', args=[section_slug, self.slug])
+
+    def _update_progeny_sections(self):
+        '''Points the Article's descendants to its section, or to the Article
+        if it is a section.
+        '''
+        self.get_progeny().update(section=self.section_id or self.pk)
+
+    def _update_url_paths(self, section_slug, cascade=False):
+        '''Stores the Article's URL path and, if @cascade is True, those of
+        its descendants, which all fall under the section with the given
+        slug.
+        '''
+        url_path = self._make_url_path(section_slug)
+        if url_path != self.url_path:
+            self.url_path = url_path
+            Article.objects.filter(pk=self.pk).update(url_path=url_path)
+        if not cascade:
+            return
+        changed = []
+        for article in self.get_progeny().only(
+                'pk', 'slug', 'parent', 'is_homepage', 'url_path'):
+            url_path = article._make_url_path(section_slug)
+            if url_path != article.url_path:
+                article.url_path = url_path
+                changed.append(article)
+        Article.objects.bulk_update(changed, ['url_path'], batch_size=500)
+
+    def _update_tree_path(self, stored_path, parent_path):
+        '''Stores the Article's tree path and moves those of its descendants
+        along with it.
+        '''
+        self.tree_path = '{}{}/'.format(parent_path, self.pk)
+        if self.tree_path == stored_path:
+            return
+        Article.objects.filter(pk=self.pk).update(tree_path=self.tree_path)
+        if stored_path:
+            Article.objects.filter(
+                tree_path_filter(stored_path)
+            ).exclude(pk=self.pk).update(tree_path=Concat(
+                Value(self.tree_path),
+                Substr('tree_path', len(stored_path) + 1)
+            ))
 
 
 class OverwriteStorage(FileSystemStorage):
@@ -368,6 +659,15 @@ class OverwriteStorage(FileSystemStorage):
         return name
 
 
+def get_media_storage():
+    '''Returns the storage for File Assets: a ContentAddressedStorage if
+    CONTENT_ADDRESSED_MEDIA is True, otherwise an OverwriteStorage.
+    '''
+    if getattr(settings, 'CONTENT_ADDRESSED_MEDIA', False):
+        return ContentAddressedStorage()
+    return OverwriteStorage()
+
+
 class FileAsset(models.Model):
     '''A FileAsset is an uploaded file that is saved in the MEDIA_ROOT, that
     has some additional information such as title, description, and alt_text.
@@ -375,7 +675,7 @@ class FileAsset(models.Model):
     media_file = models.FileField(
         blank=True,
         default=None,
-        storage=OverwriteStorage()
+        storage=get_media_storage
     )
     extension = models.CharField(max_length=8, default='', blank=True)
     title = models.CharField(max_length=255, null=True, blank=True)
@@ -390,22 +690,52 @@ class FileAsset(models.Model):
     date_made = models.DateTimeField(auto_now_add=True)
     date_edit = models.DateTimeField(auto_now=True)
 
+    # What was found on disk when the file was last verified, so that
+    # listings need not touch the filesystem. Maintained by save() and the
+    # s13verifyassets command.
+    file_exists = models.BooleanField(default=False, editable=False)
+    size_bytes = models.BigIntegerField(null=True, blank=True, editable=False)
+    sha256 = models.CharField(
+        max_length=64,
+        default='',
+        blank=True,
+        editable=False
+    )
+    mtime = models.DateTimeField(null=True, blank=True, editable=False)
+    verified_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # The renditions of the file that were made; see the renditions module.
+    rendition_files = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False
+    )
+
     class Meta:
         ordering = ['-pk']
         verbose_name = 'File Asset'
+        indexes = [
+            models.Index(fields=['extension'], name='fileasset_extension'),
+        ]
 
     def delete(self):
-        '''When a FileAsset is deleted, delete the associated file as well.'''
-
-        path = self.path_on_disk
-        if path:
-            if os.path.isfile(path):
-                os.remove(path)
+        '''When a FileAsset is deleted, delete the associated file as well,
+        unless another FileAsset uses it.
+        '''
+        user_articles = list(self.user_articles)
         super().delete()
+        self.release_file(self.media_file.name)
+        self.remove_renditions(self.sha256)
+        bump_version('content')
+        for article in user_articles:
+            pagecache.invalidate_article(article)
 
     @property
     def on_disk(self):
-        return os.path.isfile(self.path_on_disk)
+        '''Whether the file exists, as of its last verification.'''
+
+        if self.verified_at:
+            return self.file_exists
+        return bool(self.path_on_disk) and os.path.isfile(self.path_on_disk)
 
     @property
     def path_on_disk(self):
@@ -414,16 +744,69 @@ class FileAsset(models.Model):
         else:
             return None
 
+    def release_file(self, name):
+        '''Removes the file called @name from the storage, unless a FileAsset
+        still uses it.
+        '''
+        if name and not FileAsset.objects.filter(media_file=name).exists():
+            storage = self.media_file.storage
+            if storage.exists(name):
+                storage.delete(name)
+
+    def remove_renditions(self, sha256):
+        '''Removes the renditions of the file whose checksum is @sha256,
+        unless another FileAsset has the same file.
+        '''
+        if sha256 and not FileAsset.objects.filter(sha256=sha256).exists():
+            renditions.remove(sha256)
+
+    def make_renditions(self):
+        '''Makes the missing renditions of the file, one after the other, and
+        records them in rendition_files; see the renditions module.
+        '''
+        renditions.make(renditions.get_jobs(self), workers=1)
+        self.rendition_files = renditions.get_files(self)
+        FileAsset.objects.filter(pk=self.pk).update(
+            rendition_files=self.rendition_files)
+
+    def rendition(self, name):
+        '''Returns the URL of the rendition called @name, or the URL of the
+        original file if that rendition has not been made.
+        '''
+        rendition_name = self.rendition_files.get(name)
+        if rendition_name is None:
+            return self.url
+        return settings.MEDIA_URL + rendition_name
+
     @property
     def size(self):
-        '''Returns the file size in bytes.'''
+        '''Returns the file size in bytes, as of its last verification.'''
 
+        if self.verified_at:
+            return self.size_bytes or 0
         file_path = self.path_on_disk
-        if os.path.isfile(file_path):
+        if file_path and os.path.isfile(file_path):
             return os.path.getsize(file_path)
         else:
             return 0
 
+    def update_sharers(self):
+        '''Copies the information about the file to the other FileAssets
+        that use a file with the same name, which an upload may just have
+        replaced; see OverwriteStorage.
+        '''
+        sharers = FileAsset.objects.filter(
+            media_file=self.media_file.name).exclude(pk=self.pk)
+        old_sha256s = set(sharers.values_list('sha256', flat=True))
+        if not old_sha256s:
+            return
+        sharers.update(**{x: getattr(self, x) for x in [
+            'file_exists', 'size_bytes', 'mtime', 'sha256', 'verified_at',
+            'rendition_files']})
+        for sha256 in old_sha256s - {self.sha256}:
+            self.remove_renditions(sha256)
+            pagecache.invalidate_all()
+
     @property
     def user_articles(self):
         '''Returns a selection of Article objects that use this FileAsset.'''
@@ -437,7 +820,62 @@ class FileAsset(models.Model):
         else:
             return None
 
+    def verify(self, force=False, uploaded=None):
+        '''Reads the file's size, modification time, and checksum from disk
+        and stores them. The file is hashed again only if it seems to have
+        changed, or if @force is True. If the file was just @uploaded by
+        StreamingUploadHandler, the checksum it computed is used instead.
+        '''
+        if uploaded is not None:
+            info = read_file_info(
+                self.path_on_disk, uploaded.size, None, uploaded.sha256)
+        else:
+            info = read_file_info(self.path_on_disk, self.size_bytes,
+                                  self.mtime, self.sha256, force)
+        info['verified_at'] = h.get_now()
+        if info['sha256'] != self.sha256:
+            info['rendition_files'] = {}
+        for field, value in info.items():
+            setattr(self, field, value)
+        FileAsset.objects.filter(pk=self.pk).update(**info)
+
     def save(self, *args, **kwargs):
         if self.media_file:
             self.extension = self.media_file.path.lower().split('.')[-1]
-        return super().save(*args, **kwargs)
+        old_name = None
+        if self.pk:
+            old_name = FileAsset.objects.filter(pk=self.pk).values_list(
+                'media_file', flat=True).first()
+        is_upload = bool(self.media_file) and not self.media_file._committed
+        # Uploads streamed by StreamingUploadHandler come with a checksum.
+        uploaded = None
+        if is_upload and getattr(self.media_file.file, 'sha256', None):
+            uploaded = self.media_file.file
+        result = super().save(*args, **kwargs)
+        # The file is written to disk by super().save().
+        if old_name != self.media_file.name:
+            self.release_file(old_name)
+        old_sha256 = self.sha256
+        self.verify(uploaded=uploaded)
+        if old_sha256 != self.sha256:
+            self.remove_renditions(old_sha256)
+        if getattr(settings, 'RENDITIONS_EAGER', False):
+            self.make_renditions()
+        if is_upload:
+            self.update_sharers()
+        bump_version('content')
+        for article in self.user_articles:
+            pagecache.invalidate_article(article)
+        return result
+
+
+def bump_content_version(sender, instance, **kwargs):
+    bump_version('content')
+    if isinstance(instance, Article):
+        pagecache.invalidate_article(instance)
+    else:
+        pagecache.invalidate_all()
+
+
+m2m_changed.connect(bump_content_version, sender=Article.media.through)
+m2m_changed.connect(bump_content_version, sender=Article.sidelinks.through)
@@ -0,0 +1,89 @@
+'''Full-page response cache for anonymous visitors of the public views.
+
+Caching is enabled by setting PAGE_CACHE_TIMEOUT to a number of seconds and
+adding PageCacheMiddleware to the MIDDLEWARE setting. Responses are stored
+in the Django cache named by PAGE_CACHE_ALIAS ('default' by default).
+
+Every cached page is keyed on its path, its "p", "q", and "c" arguments, and
+a few version stamps: one for the website settings, one for all pages, and
+one for the page's path. Saving content bumps the stamps of the pages that
+may show it; saving a section or moving an article bumps the stamp for all
+pages because the navigation or URLs change.
+'''
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from s13core.caching import bump_version
+from s13core.caching import get_version
+
+
+QUERY_ARGUMENTS = ['p', 'q', 'c']
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 0)
+
+
+def invalidate_all():
+    '''Expires every cached page.'''
+
+    bump_version('pages')
+
+
+def get_neighbour_paths(article):
+    '''Returns the paths of the given Article's previous and next siblings.'''
+
+    return [x.make_url() for x in article.get_previous_and_next() if x]
+
+
+def invalidate_article(article, paths=()):
+    '''Expires the cached pages that may show the given Article: its own,
+    its ancestors', its previous and next siblings', the homepage, and the
+    keyword search results, as well as the pages at @paths.
+    '''
+    if not is_enabled():
+        return
+    paths = list(paths) + [
+        reverse('s13cms:homepage'),
+        reverse('s13cms:keyword-search'),
+        article.make_url(),
+    ]
+    ancestry = article.get_ancestry()
+    section_map = {x.pk: x for x in ancestry[-1:]}
+    paths += [x.make_url(section_map) for x in ancestry]
+    paths += get_neighbour_paths(article)
+    for path in set(paths):
+        invalidate_path(path)
+
+
+def invalidate_path(path):
+    '''Expires the cached versions of the page at @path.'''
+
+    bump_version('page:{}'.format(path))
+
+
+def is_enabled():
+    return bool(get_timeout())
+
+
+def make_key(request):
+    '''Returns the cache key for the page requested.'''
+
+    path = request.path
+    query = urlencode(sorted(
+        (x, request.GET[x]) for x in QUERY_ARGUMENTS if x in request.GET))
+    return 's13core:page:{}'.format(hashlib.md5('\n'.join([
+        get_version('settings'),
+        get_version('pages'),
+        get_version('page:{}'.format(path)),
+        path,
+        query,
+    ]).encode('utf-8')).hexdigest())
@@ -0,0 +1,186 @@
+'''Keyset (cursor) pagination for Article selections.
+
+Instead of counting rows and skipping over an OFFSET, a keyset page starts
+right after, or right before, the last row that was shown. The position is
+passed around as an opaque cursor that holds the sort value and pk of that
+row; the pk breaks ties between rows with equal sort values.
+'''
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F
+from django.db.models import Q
+
+
+def encode_cursor(field, item, backwards=False):
+    '''Makes a cursor pointing at @item.'''
+
+    value = getattr(item, field)
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    data = json.dumps(['b' if backwards else 'f', value, item.pk])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')\
+        .rstrip('=')
+
+
+def decode_cursor(model, field, cursor):
+    '''Reads a cursor made by encode_cursor. Returns a tuple of the direction
+    (True when going backwards), sort value, and pk. Raises ValueError if
+    the cursor is invalid.
+    '''
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, value, pk = json.loads(data.decode('utf-8'))
+        if value is not None and field != 'pk':
+            value = model._meta.get_field(field).to_python(value)
+        pk = int(pk)
+    except Exception:
+        raise ValueError('Invalid cursor.')
+    if direction not in ['b', 'f']:
+        raise ValueError('Invalid cursor.')
+    return direction == 'b', value, pk
+
+
+def parse_sort_key(model, sort_key):
+    '''Splits a sort key like "-date_edit" into a field name and a flag that
+    is True for descending orders. Raises ValueError for unknown fields.
+    '''
+    descending = sort_key.startswith('-')
+    field = sort_key.lstrip('-')
+    if field != 'pk':
+        try:
+            model._meta.get_field(field)
+        except FieldDoesNotExist:
+            raise ValueError('Cannot sort by {}.'.format(field))
+    return field, descending
+
+
+def make_ordering(field, descending):
+    '''Returns order_by() arguments for a keyset on @field with the pk as a
+    tiebreaker. Nulls always sort as the smallest values.
+    '''
+    if field == 'pk':
+        return [F('pk').desc() if descending else F('pk').asc()]
+    if descending:
+        return [F(field).desc(nulls_last=True), F('pk').desc()]
+    return [F(field).asc(nulls_first=True), F('pk').asc()]
+
+
+def make_filters(field, descending, value, pk, null=True):
+    '''Returns a list of filters for the rows that come after the row with the
+    given sort @value and @pk, in the order given by make_ordering. Each filter
+    selects a consecutive part of that order and is a plain range on the sort
+    field, so that it can seek in an index on it; the nulls, which sort as the
+    smallest values, are a part of their own unless @null is False.
+    '''
+    after_pk = Q(pk__lt=pk) if descending else Q(pk__gt=pk)
+    if field == 'pk':
+        return [after_pk]
+    isnull = '{}__isnull'.format(field)
+    if value is None:
+        if descending:
+            return [Q(**{isnull: True}) & after_pk]
+        return [Q(**{isnull: True}) & after_pk, Q(**{isnull: False})]
+    if descending:
+        filters = [Q(**{'{}__lte'.format(field): value}) &
+                   (Q(**{'{}__lt'.format(field): value}) | after_pk)]
+        if null:
+            filters.append(Q(**{isnull: True}))
+        return filters
+    return [Q(**{'{}__gte'.format(field): value}) &
+            (Q(**{'{}__gt'.format(field): value}) | after_pk)]
+
+
+def fetch_after(queryset, field, descending, value, pk, limit):
+    '''Returns a list of at most @limit rows of @queryset that come after the
+    row with the given sort @value and @pk, querying the parts given by
+    make_filters in turn until there are enough rows.
+    '''
+    null = field != 'pk' and queryset.model._meta.get_field(field).null
+    ordering = make_ordering(field, descending)
+    items = []
+    for q in make_filters(field, descending, value, pk, null):
+        items += queryset.filter(q).order_by(*ordering)[:limit - len(items)]
+        if len(items) >= limit:
+            break
+    return items
+
+
+class KeysetPage:
+    '''A page of results, with the same has_next/has_previous interface as
+    Django's Page, and cursors for the neighbouring pages.
+    '''
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    '''Paginates a QuerySet by keyset according to a sort key like those in
+    Article.sort_children.
+
+    Arguments:
+        queryset - the QuerySet to paginate; its ordering is replaced
+        per_page - number of items per page
+        sort_key - a field name, optionally prefixed with "-"
+    '''
+    def __init__(self, queryset, per_page, sort_key):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field, self.descending = parse_sort_key(
+            queryset.model, sort_key)
+
+    def page(self, cursor=None):
+        '''Returns the KeysetPage that the given cursor points to, or the first
+        page if there is no cursor. Raises ValueError for invalid cursors.
+        '''
+        if not cursor:
+            items = self._fetch(self.descending)
+            has_more = len(items) > self.per_page
+            items = items[:self.per_page]
+            return self._make_page(items, has_more, False)
+        backwards, value, pk = decode_cursor(
+            self.queryset.model, self.field, cursor)
+        # Going backwards means walking the reversed order.
+        descending = self.descending != backwards
+        items = fetch_after(self.queryset, self.field, descending, value, pk,
+                            self.per_page + 1)
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backwards:
+            items.reverse()
+            return self._make_page(items, True, has_more)
+        return self._make_page(items, has_more, True)
+
+    def _fetch(self, descending):
+        selection = self.queryset.order_by(
+            *make_ordering(self.field, descending))
+        return list(selection[:self.per_page + 1])
+
+    def _make_page(self, items, has_next, has_previous):
+        next_cursor = None
+        previous_cursor = None
+        if items and has_next:
+            next_cursor = encode_cursor(self.field, items[-1])
+        if items and has_previous:
+            previous_cursor = encode_cursor(self.field, items[0], True)
+        return KeysetPage(items, next_cursor, previous_cursor)
@@ -0,0 +1,56 @@
+'''Query budgets: the most database queries that a view may run to answer a
+request, including rendering its template. Views declare them with a
+query_budget attribute; QueryBudgetMiddleware and the tests check them.
+'''
+from contextlib import ExitStack
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    '''A database execute wrapper that counts queries; see
+    connection.execute_wrapper.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+def check(view_class, counter, path=''):
+    '''Raises QueryBudgetExceeded if @counter went over the budget of
+    @view_class.
+    '''
+    budget = get_budget(view_class)
+    if budget is not None and counter.count > budget:
+        raise QueryBudgetExceeded(
+            '{} ran {} queries for {}; its budget is {}:\n{}'.format(
+                view_class.__name__, counter.count, path, budget,
+                '\n'.join(counter.queries)))
+
+
+@contextmanager
+def count_queries():
+    '''Counts the queries run on every database connection in the enclosed
+    block. Yields a QueryCounter.
+    '''
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+def get_budget(view_class):
+    '''Returns the query budget of @view_class; None if it has none.'''
+
+    return getattr(view_class, 'query_budget', None)
@@ -0,0 +1,109 @@
+'''The latest public articles shown on the homepage.
+
+The list is kept in the Django cache as a projection of the few columns the
+homepage needs, including the URL path, and is updated in place whenever an
+Article is saved. A few more rows than RECENT_ARTICLES_COUNT (32) are kept
+so that unpublishing an article rarely calls for querying them all again.
+'''
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+CACHE_KEY = 's13core:recent-articles'
+FIELDS = ['pk', 'title', 'description', 'url_path', 'date_made']
+
+
+class RecentArticle(namedtuple('RecentArticle', FIELDS)):
+    __slots__ = ()
+
+    def make_url(self):
+        return self.url_path
+
+
+def get_articles(homepage):
+    '''Returns a list of the latest public articles, newest first, leaving
+    out sections and the children of the @homepage Article.
+    '''
+    homepage_pk = homepage.pk if homepage else None
+    payload = cache.get(CACHE_KEY)
+    if payload is None or payload['homepage_pk'] != homepage_pk:
+        payload = rebuild(homepage_pk)
+    return payload['items'][:get_count()]
+
+
+def get_count():
+    return getattr(settings, 'RECENT_ARTICLES_COUNT', 32)
+
+
+def get_size():
+    '''Returns the number of rows kept, a few more than are shown.'''
+
+    return get_count() + max(8, get_count() // 4)
+
+
+def get_timeout():
+    return getattr(settings, 'RECENT_ARTICLES_TIMEOUT', 3600)
+
+
+def invalidate():
+    '''Forgets the list; the next homepage request queries it again.'''
+
+    cache.delete(CACHE_KEY)
+
+
+def make_item(article):
+    return RecentArticle(*[getattr(article, x) for x in FIELDS])
+
+
+def rebuild(homepage_pk):
+    '''Queries the list and stores it. Returns the stored payload.'''
+
+    from .models import Article
+    size = get_size()
+    selection = Article.objects.filter(is_public=True).exclude(parent=None)
+    if homepage_pk:
+        selection = selection.exclude(parent=homepage_pk)
+    items = [make_item(x) for x in selection.only(*FIELDS).order_by(
+        '-date_made', '-pk')[:size]]
+    payload = {
+        'homepage_pk': homepage_pk,
+        'items': items,
+        # Whether every article that qualifies is in the list.
+        'is_complete': len(items) < size,
+    }
+    cache.set(CACHE_KEY, payload, get_timeout())
+    return payload
+
+
+def update(article):
+    '''Adds, moves, or removes the given Article in the stored list.'''
+
+    payload = cache.get(CACHE_KEY)
+    if payload is None:
+        return
+    items = [x for x in payload['items'] if x.pk != article.pk]
+    if article.is_public and article.parent_id is not None and \
+            article.parent_id != payload['homepage_pk']:
+        item = make_item(article)
+        # An incomplete list does not know what comes after its last item.
+        if payload['is_complete'] or not items or \
+                sort_key(item) > sort_key(items[-1]):
+            items.append(item)
+            items.sort(key=sort_key, reverse=True)
+        if len(items) > get_size():
+            items = items[:get_size()]
+            payload['is_complete'] = False
+    if len(items) < get_count() and not payload['is_complete']:
+        invalidate()
+        return
+    payload['items'] = items
+    cache.set(CACHE_KEY, payload, get_timeout())
+
+
+def sort_key(item):
+    # Like the query: newest first, articles without a date last.
+    if item.date_made is None:
+        return False, 0, item.pk
+    return True, item.date_made.timestamp(), item.pk
@@ -0,0 +1,161 @@
+'''Renditions: smaller copies of image File Assets, like thumbnails, made with
+Pillow if it is installed.
+
+Renditions are stored under MEDIA_ROOT/renditions, named after the checksum
+of the original file and the size and quality of the rendition, so that
+identical uploads share their renditions and changed files get new ones.
+They are made by the s13renditions command, which makes them in parallel on
+a process pool, or by FileAsset.save() one after the other if
+RENDITIONS_EAGER is True. Each FileAsset records the renditions that were
+made in its rendition_files, so showing them needs no filesystem access.
+'''
+import glob
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+try:
+    from PIL import Image
+    from PIL import ImageOps
+except ImportError:
+    Image = None
+
+
+DIRECTORY = 'renditions'
+IMAGE_EXTENSIONS = ['bmp', 'gif', 'jpeg', 'jpg', 'png', 'tif', 'tiff', 'webp']
+# Formats are tried in order and the first one Pillow can write is used.
+RENDITIONS = {
+    'thumb': {'size': (320, 320), 'formats': ['webp', 'jpeg']},
+    'medium': {'size': (1280, 1280), 'formats': ['avif', 'webp', 'jpeg']},
+}
+EXTENSIONS = {'jpeg': 'jpg'}
+
+
+def get_renditions():
+    return getattr(settings, 'RENDITIONS', RENDITIONS)
+
+
+def get_format(spec):
+    '''Returns the first format of @spec that Pillow can write; None if
+    there is none, or if Pillow is not installed.
+    '''
+    if Image is None:
+        return None
+    Image.init()
+    for fmt in spec.get('formats', ['jpeg']):
+        if fmt.upper() in Image.SAVE:
+            return fmt
+    return None
+
+
+def get_name(sha256, spec):
+    '''Returns the name, relative to MEDIA_ROOT, of the rendition described
+    by @spec of a file whose checksum is @sha256; None if it cannot be made.
+    '''
+    fmt = get_format(spec)
+    if not sha256 or fmt is None:
+        return None
+    return '{}/{}/{}-{}x{}q{}.{}'.format(
+        DIRECTORY, sha256[:2], sha256[:32], spec['size'][0], spec['size'][1],
+        spec.get('quality', 80), EXTENSIONS.get(fmt, fmt))
+
+
+def get_files(asset):
+    '''Returns a dictionary of the names of the renditions of @asset that
+    exist, like {'thumb': 'renditions/ab/ab...-320x320q80.webp'}, to be
+    stored in its rendition_files.
+    '''
+    if not is_image(asset):
+        return {}
+    files = {}
+    for name, spec in get_renditions().items():
+        rendition_name = get_name(asset.sha256, spec)
+        if rendition_name and os.path.isfile(
+                os.path.join(settings.MEDIA_ROOT, rendition_name)):
+            files[name] = rendition_name
+    return files
+
+
+def get_jobs(asset, names=None, force=False):
+    '''Returns a list of (source path, destination path, spec) tuples for
+    the renditions of @asset that need to be made; all renditions if @names
+    is None. Existing renditions are made again only if @force is True.
+    '''
+    if not is_image(asset):
+        return []
+    jobs = []
+    for name, spec in get_renditions().items():
+        if names is not None and name not in names:
+            continue
+        rendition_name = get_name(asset.sha256, spec)
+        if rendition_name is None:
+            continue
+        path = os.path.join(settings.MEDIA_ROOT, rendition_name)
+        if force or not os.path.isfile(path):
+            jobs.append((asset.path_on_disk, path, spec))
+    return jobs
+
+
+def is_image(asset):
+    '''Whether renditions of @asset can be made.'''
+
+    return Image is not None and asset.extension in IMAGE_EXTENSIONS and \
+        bool(asset.sha256) and asset.on_disk
+
+
+def make(jobs, workers=None):
+    '''Makes the renditions of a list of @jobs from get_jobs(), on a pool of
+    @workers processes; RENDITIONS_WORKERS by default. Returns the number of
+    renditions that were made. Do not use a pool while answering requests.
+    '''
+    if workers is None:
+        workers = getattr(settings, 'RENDITIONS_WORKERS', os.cpu_count())
+    if workers and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(make_rendition, *zip(*jobs)))
+    else:
+        results = [make_rendition(*x) for x in jobs]
+    return len([x for x in results if x])
+
+
+def make_rendition(source, destination, spec):
+    '''Writes a rendition of the image at @source, fitted inside the size of
+    @spec, to @destination. Returns False if the image cannot be read.
+
+    Runs in worker processes, so it touches only the filesystem.
+    '''
+    fmt = get_format(spec)
+    directory = os.path.dirname(destination)
+    os.makedirs(directory, exist_ok=True)
+    # Written under another name first so that a half-written rendition is
+    # never served.
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(handle)
+    try:
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            image.thumbnail(spec['size'])
+            if fmt == 'jpeg' and image.mode not in ('L', 'RGB'):
+                image = image.convert('RGB')
+            elif image.mode not in ('L', 'RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            image.save(temporary, fmt.upper(),
+                       quality=spec.get('quality', 80))
+        os.replace(temporary, destination)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        os.remove(temporary)
+        return False
+    return True
+
+
+def remove(sha256):
+    '''Removes every rendition of the file whose checksum is @sha256.'''
+
+    if not sha256:
+        return
+    pattern = os.path.join(
+        settings.MEDIA_ROOT, DIRECTORY, sha256[:2], sha256[:32] + '-*')
+    for path in glob.glob(pattern):
+        os.remove(path)
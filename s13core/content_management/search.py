@@ -0,0 +1,240 @@
+'''Full-text search for Articles.
+
+On SQLite, Articles are indexed in an FTS5 virtual table that Article.save()
+and Article.delete() keep up to date. Other databases, and SQLite builds
+without FTS5, fall back to ranking the matching rows in Python.
+'''
+import html
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.html import strip_tags
+
+
+FTS_TABLE = 'content_management_article_fts'
+
+# Indexed fields and their weights when ranking results.
+FIELDS = (
+    ('title', 10.0),
+    ('keywords', 5.0),
+    ('description', 2.0),
+    ('body', 1.0),
+)
+
+JINJA_RE = re.compile(r'{%.*?%}|{{.*?}}|{#.*?#}', re.S)
+TERM_RE = re.compile(r'\w+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Snippet match markers; replaced by <mark> elements after escaping.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def make_plain_text(text):
+    '''Strips Jinja2 code and HTML tags from @text.'''
+
+    if not text:
+        return ''
+    text = html.unescape(strip_tags(JINJA_RE.sub(' ', text)))
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+
+def make_snippet_html(snippet):
+    '''Escapes a snippet and turns its match markers into <mark> elements.'''
+
+    return escape(snippet).replace(MARK_START, '<mark>')\
+        .replace(MARK_END, '</mark>')
+
+
+class SearchIndex:
+    '''Maintains and queries the Article full-text search index.'''
+
+    snippet_words = 16
+
+    def __init__(self):
+        self._has_table = False
+
+    @property
+    def max_results(self):
+        return getattr(settings, 'MAX_SEARCH_RESULTS', 500)
+
+    def create(self, schema_editor=None):
+        '''Creates the FTS5 table if the database supports it. Returns True
+        if the table is available.
+        '''
+        conn = schema_editor.connection if schema_editor else connection
+        if conn.vendor != 'sqlite':
+            return False
+        with conn.cursor() as cursor:
+            try:
+                cursor.execute(
+                    'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, '
+                    'tokenize="unicode61 remove_diacritics 2")'.format(
+                        FTS_TABLE, ', '.join(x[0] for x in FIELDS))
+                )
+            except Exception:
+                # SQLite was built without FTS5.
+                return False
+        return True
+
+    def drop(self, schema_editor=None):
+        conn = schema_editor.connection if schema_editor else connection
+        if conn.vendor == 'sqlite':
+            with conn.cursor() as cursor:
+                cursor.execute('DROP TABLE IF EXISTS {}'.format(FTS_TABLE))
+        self._has_table = False
+
+    def is_available(self):
+        '''Evaluates whether the FTS5 table can be used.'''
+
+        if self._has_table:
+            return True
+        if connection.vendor != 'sqlite':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM sqlite_master WHERE type = %s AND name = %s',
+                ['table', FTS_TABLE]
+            )
+            self._has_table = cursor.fetchone() is not None
+        return self._has_table
+
+    def rebuild(self, articles):
+        '''Replaces the whole index with documents made from @articles.'''
+
+        if not self.is_available():
+            return 0
+        count = 0
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(FTS_TABLE))
+            for article in articles:
+                self._insert(cursor, article)
+                count += 1
+        return count
+
+    def remove(self, pk):
+        '''Removes the Article with the given pk from the index.'''
+
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [pk])
+
+    def search(self, model, term):
+        '''Returns a list of public, non-section Articles matching all the
+        words in @term, best matches first. Each Article has additional
+        search_rank and search_snippet attributes.
+        '''
+        words = TERM_RE.findall(term.lower())
+        if not words:
+            return []
+        if self.is_available():
+            return self._search_index(model, words)
+        return self._search_rows(model, words)
+
+    def update(self, article):
+        '''Indexes, or re-indexes, the given Article.'''
+
+        if not self.is_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE),
+                [article.pk]
+            )
+            self._insert(cursor, article)
+
+    def _get_document(self, article):
+        return [
+            article.title or '',
+            article.keywords or '',
+            article.description or '',
+            make_plain_text(article.body),
+        ]
+
+    def _insert(self, cursor, article):
+        cursor.execute(
+            'INSERT INTO {} (rowid, {}) VALUES (%s, %s, %s, %s, %s)'.format(
+                FTS_TABLE, ', '.join(x[0] for x in FIELDS)),
+            [article.pk] + self._get_document(article)
+        )
+
+    def _search_index(self, model, words):
+        # Quote every word so that FTS5 operators are taken literally, and
+        # match them as prefixes.
+        match = ' '.join('"{}"*'.format(x) for x in words)
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT {fts}.rowid, bm25({fts}, {weights}), '
+                'snippet({fts}, -1, %s, %s, %s, %s) '
+                'FROM {fts} INNER JOIN {table} '
+                'ON {table}.{pk} = {fts}.rowid '
+                'WHERE {fts} MATCH %s AND {table}.is_public '
+                'AND {table}.parent_id IS NOT NULL '
+                'ORDER BY 2, {table}.date_edit DESC LIMIT %s'.format(
+                    fts=FTS_TABLE,
+                    table=table,
+                    pk=model._meta.pk.column,
+                    weights=', '.join(str(x[1]) for x in FIELDS)
+                ),
+                [MARK_START, MARK_END, '…', self.snippet_words, match,
+                 self.max_results]
+            )
+            rows = cursor.fetchall()
+        articles = model.objects.select_related('image').in_bulk(
+            [x[0] for x in rows])
+        results = []
+        for pk, rank, snippet in rows:
+            if pk in articles:
+                article = articles[pk]
+                # BM25 scores are negative; better matches are lower.
+                article.search_rank = -rank
+                article.search_snippet = make_snippet_html(snippet)
+                results.append(article)
+        return results
+
+    def _search_rows(self, model, words):
+        selection = model.objects.select_related('image')\
+            .filter(is_public=True)\
+            .exclude(parent=None).order_by('-date_edit')
+        for word in words:
+            q = Q()
+            for field, weight in FIELDS:
+                q |= Q(**{'{}__icontains'.format(field): word})
+            selection = selection.filter(q)
+        results = []
+        for article in selection[:self.max_results]:
+            document = [x.lower() for x in self._get_document(article)]
+            article.search_rank = sum(
+                weight * document[i].count(word)
+                for i, (field, weight) in enumerate(FIELDS)
+                for word in words
+            )
+            article.search_snippet = self._make_snippet(
+                make_plain_text(article.body), words)
+            results.append(article)
+        # Python's sort is stable so ties stay freshest first.
+        results.sort(key=lambda x: x.search_rank, reverse=True)
+        return results
+
+    def _make_snippet(self, text, words):
+        lowered = text.lower()
+        positions = [lowered.find(x) for x in words if x in lowered]
+        if not positions:
+            return ''
+        start = max(0, min(positions) - 60)
+        end = min(len(text), start + 8 * self.snippet_words)
+        snippet = text[start:end]
+        pattern = re.compile(
+            '({})'.format('|'.join(re.escape(x) for x in words)), re.I)
+        snippet = pattern.sub(MARK_START + r'\1' + MARK_END, snippet)
+        return make_snippet_html('{}{}{}'.format(
+            '…' if start else '', snippet, '…' if end < len(text) else ''))
+
+
+search_index = SearchIndex()
@@ -0,0 +1,79 @@
+'''Content-addressed storage for File Assets, used instead of OverwriteStorage
+if CONTENT_ADDRESSED_MEDIA is True.
+
+Files are stored once under a name made from the SHA-256 checksum of their
+contents, like blobs/ab/ab12...ef.pdf, so that uploading the same file again
+takes no more space. A stored file may be shared by several File Assets, so
+FileAsset removes it only when no other File Asset refers to it.
+'''
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+
+
+DIRECTORY = 'blobs'
+
+
+def get_blob_name(sha256, name):
+    '''Returns the name of the blob with the checksum @sha256 and the
+    extension of @name.
+    '''
+    extension = os.path.splitext(name)[1].lower()
+    return '{}/{}/{}{}'.format(DIRECTORY, sha256[:2], sha256, extension)
+
+
+def is_blob_name(name):
+    return name.startswith(DIRECTORY + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the contents are read; see
+        # _save().
+        return name
+
+    def _save(self, name, content):
+        # Upload handlers may have computed the checksum already.
+        sha256 = getattr(content, 'sha256', None)
+        if not sha256:
+            digest = hashlib.sha256()
+            for chunk in content.chunks():
+                digest.update(chunk)
+            sha256 = digest.hexdigest()
+        name = get_blob_name(sha256, name)
+        path = self.path(name)
+        if os.path.isfile(path):
+            return name
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Files written by upload handlers are moved into place if they are
+        # on the same filesystem.
+        if hasattr(content, 'temporary_file_path'):
+            try:
+                os.replace(content.temporary_file_path(), path)
+            except OSError:
+                pass
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+                return name
+        # Written under another name first so that a half-written file is
+        # never served; files with the same name have the same contents, so
+        # whichever process renames last does no harm.
+        temporary = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        try:
+            handle = os.open(
+                temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            with os.fdopen(handle, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.isfile(temporary):
+                os.remove(temporary)
+            raise
+        return name
@@ -1,11 +1,47 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+from unittest import mock
+from unittest import skipIf
+
+from django.conf import settings as s
+from django.core.cache import cache
 from django.contrib.auth.models import User
-from django.test import Client, TestCase
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
 from django.urls import reverse
+from jinja2 import FileSystemLoader
 
 from s13core import helpers as h
+from s13core import jinja2env
+from s13core.administration import stats
+from s13core.caching import LRUCache
+from s13core.caching import bump_version
+from s13core.caching import get_version
+from s13core.jinja2env import compile_template
+from s13core.jinja2env import compiled_templates
 from s13core.settings.models import Setting
 
+from . import fileinfo
+from . import pagecache
+from . import querybudget
+from . import recent
+from . import renditions
 from .models import Article
+from .models import FileAsset
+from .pagination import KeysetPaginator
+from .search import search_index
+from .storage import ContentAddressedStorage
+from .views import ArticleView
 
 
 class HttpTests(TestCase):
@@ -35,6 +71,26 @@ class HttpTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Home Page', str(response.content))
 
+    def test_site_nav_after_not_found(self):
+        # The site navigation of a 404 page is not shown on other pages.
+        Article.objects.filter(is_homepage=True).update(is_homepage=False)
+        cache.clear()
+        response = self.c.get(reverse('s13cms:section', args=['no-section']))
+        self.assertEqual(response.status_code, 404)
+        response = self.c.get(reverse('s13cms:homepage'))
+        nav = re.search(r'<ul class="site-nav">(.*?)</ul>',
+                        response.content.decode(), re.S).group(1)
+        self.assertIn('Section Page', nav)
+
+    def test_article_body_is_rendered(self):
+        article = Article.objects.get(slug='article')
+        article.body = '<p>{{ article.slug }}</p>'
+        article.save()
+        response = self.c.get(article.make_url())
+        self.assertEqual(response.context_data['article'].body,
+                         '<p>article</p>')
+        self.assertIn('<p>article</p>', response.content.decode())
+
     def test_section(self):
         # There is no section with slug: no-section.
         response = self.c.get(reverse('s13cms:section', args=['no-section']))
@@ -58,21 +114,151 @@ class HttpTests(TestCase):
 
     def test_sitemap(self):
         expected = [
-            x.make_url() for x in Article.objects.all().order_by('-pk')
+            x.make_url() for x in Article.objects.all().order_by('pk')
         ]
         response = self.c.get(reverse('s13cms:sitemap'))
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.headers.get('Content-Type'), 'text/plain')
+        self.assertEqual(response.headers.get('Content-Type'),
+                         'application/xml; charset=utf-8')
 
-        retrieved = response.content.decode('utf-8').split('\n')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        retrieved = re.findall(r'<loc>http://testserver(.+?)</loc>', content)
 
-        self.assertEqual(len(retrieved), len(expected))
+        self.assertEqual(retrieved, expected)
+        self.assertEqual(content.count('<lastmod>'), len(expected))
 
         for url in retrieved:
             response = self.c.get(url)
             self.assertEqual(response.status_code, 200)
 
+        # Crawlers that have the latest sitemap get a 304 response.
+        last_modified = self.c.get(
+            reverse('s13cms:sitemap')).headers['Last-Modified']
+        response = self.c.get(
+            reverse('s13cms:sitemap'),
+            headers={'If-Modified-Since': last_modified}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(MAX_SITEMAP_LINKS=2)
+    def test_sitemap_index(self):
+        response = self.c.get(reverse('s13cms:sitemap'))
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('<sitemapindex', content)
+        pages = re.findall(r'<loc>http://testserver(.+?)</loc>', content)
+        self.assertEqual(len(pages), 2)
+        urls = []
+        for page in pages:
+            response = self.c.get(page)
+            content = b''.join(response.streaming_content).decode('utf-8')
+            urls += re.findall(r'<loc>(.+?)</loc>', content)
+        self.assertEqual(len(urls), Article.objects.count())
+        for page in [0, 3]:
+            response = self.c.get(reverse('s13cms:sitemap', args=[page]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_conditional_get(self):
+        url = reverse('s13cms:article', args=['section', 'article'])
+        response = self.c.get(url)
+        etag = response.headers['ETag']
+        response = self.c.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        response = self.c.get(url, headers={
+            'If-Modified-Since': response.headers['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+        # Content changes elsewhere may change the page, like its navigation.
+        Article(slug='new-section', title='New Section').save()
+        response = self.c.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=60)
+    def test_page_cache(self):
+        url = reverse('s13cms:article', args=['section', 'article'])
+        self.assertEqual(self.c.get(url).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.c.get(url)
+        self.assertIn('Article Page', response.content.decode())
+        # Hits have the headers of the response that was stored.
+        cache.clear()
+        miss = self.c.get(url)
+        hit = self.c.get(url)
+        self.assertEqual(hit.headers['X-Frame-Options'], 'DENY')
+        for response in [miss, hit]:
+            # Measured for each request.
+            response.headers.pop('Server-Timing', None)
+        self.assertEqual(dict(hit.headers), dict(miss.headers))
+        # Saving the article expires its page.
+        article = Article.objects.get(slug='article')
+        article.title = 'Changed Title'
+        article.save()
+        self.assertIn('Changed Title', self.c.get(url).content.decode())
+        # Moving the article in its parent's order expires the pages of its
+        # old neighbours as well as its new ones.
+        section = Article.objects.get(slug='section')
+        section.sort_children = 'weight'
+        section.save()
+        for i in range(3):
+            Article(slug='sibling-{}'.format(i), weight=i * 2,
+                    parent=section).save()
+        article = Article.objects.get(slug='article')
+        article.weight = 1
+        article.save()
+        paths = pagecache.get_neighbour_paths(article)
+        self.assertEqual(len(paths), 2)
+        versions = [get_version('page:{}'.format(x)) for x in paths]
+        article.weight = 5
+        article.save()
+        for path, version in zip(paths, versions):
+            self.assertNotEqual(get_version('page:{}'.format(path)), version)
+        # Logged-in users are not served from the cache.
+        self.c.login(username='admin', password='admin-password!')
+        Article.objects.filter(pk=article.pk).update(title='Not Saved')
+        self.assertIn('Not Saved', self.c.get(url).content.decode())
+        self.c.logout()
+
+    def test_keyword_search(self):
+        response = self.c.get(reverse('s13cms:keyword-search'))
+        self.assertEqual(response.status_code, 200)
+        Article(slug='findable', title='Findable', body='<p>Needle</p>',
+                parent=Article.objects.get(slug='section')).save()
+        response = self.c.get(
+            reverse('s13cms:keyword-search'), {'q': 'needle'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('<mark>Needle</mark>', response.content.decode())
+
+    @override_settings(KEYSET_PAGINATION=True)
+    def test_section_keyset_pagination(self):
+        section = Article.objects.get(slug='section')
+        section.include_children = 1
+        section.save()
+        Article(slug='another', title='Another Article',
+                parent=section).save()
+        url = reverse('s13cms:section', args=['section'])
+        response = self.c.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Another Article', response.content.decode())
+        cursor = re.search(
+            r'\?c=([\w-]+)" rel="next"', response.content.decode()).group(1)
+        response = self.c.get(url, {'c': cursor})
+        self.assertIn('Article Page', response.content.decode())
+
+    def test_server_timing(self):
+        url = reverse('s13cms:article', args=['section', 'article'])
+        with override_settings(REQUEST_TIMING_SAMPLE_RATE=1), \
+                self.assertLogs('s13core.timing', 'INFO') as logs:
+            response = self.c.get(url)
+        metrics = [x.split(';')[0] for x in
+                   response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['db', 'template', 'total'])
+        timing = logs.records[0].timing
+        self.assertEqual(timing['url_name'], 's13cms:article')
+        self.assertGreater(timing['queries'], 0)
+        with override_settings(REQUEST_TIMING_SAMPLE_RATE=0):
+            response = self.c.get(url)
+        self.assertNotIn('Server-Timing', response.headers)
+
 
 class ModelArticleTests(TestCase):
     def setUp(self):
@@ -151,3 +337,750 @@ class ModelArticleTests(TestCase):
         a = Article.objects.get(slug='child-0')
         self.assertEqual(len(a.get_siblings()), 0)
         self.assertEqual(len(a.get_siblings(exclude_private=False)), 4)
+
+    def test_rendered_body_is_lazy(self):
+        Article(slug='section', body='{{ article.slug }}').save()
+        compiled_templates.clear()
+        section = Article.objects.get_sections()[0]
+        self.assertEqual(compiled_templates.misses, 0)
+        self.assertEqual(section.rendered_body, 'section')
+        self.assertEqual(section.rendered_body, 'section')
+        self.assertEqual(compiled_templates.misses, 1)
+        self.assertEqual(compiled_templates.hits, 0)
+
+    def test_pre_render(self):
+        compiled_templates.clear()
+        body = '<p>{{ article.slug }}</p>'
+        for slug in ['first', 'second']:
+            a = Article(slug=slug, body=body)
+            a.pre_render()
+            self.assertEqual(a.body, '<p>{}</p>'.format(slug))
+        # The second article reused the template compiled for the first.
+        self.assertEqual(compiled_templates.misses, 1)
+        self.assertEqual(compiled_templates.hits, 1)
+
+    def test_tree_index(self):
+        root = Article(slug='root')
+        root.save()
+        branch = Article(slug='branch', parent=root)
+        branch.save()
+        leaf = Article(slug='leaf', parent=branch)
+        leaf.save()
+        self.assertEqual(leaf.tree_path, '{}/{}/{}/'.format(
+            root.pk, branch.pk, leaf.pk))
+        leaf = Article.objects.get(slug='leaf')
+        with self.assertNumQueries(1):
+            self.assertEqual(leaf.get_ancestry(), [branch, root])
+        with self.assertNumQueries(1):
+            self.assertEqual(leaf.get_section(), root)
+        self.assertEqual(list(root.get_progeny().order_by('pk')),
+                         [branch, leaf])
+        # Reparenting moves the whole branch.
+        other = Article(slug='other')
+        other.save()
+        branch.parent = other
+        branch.save()
+        leaf = Article.objects.get(slug='leaf')
+        self.assertEqual(leaf.get_section(), other)
+        self.assertEqual(len(root.get_progeny()), 0)
+        # An Article cannot be moved under one of its descendants.
+        other.parent = leaf
+        self.assertRaises(ValidationError, other.save)
+        # Deleting a parent turns its children into sections.
+        other = Article.objects.get(slug='other')
+        other.delete()
+        leaf = Article.objects.get(slug='leaf')
+        self.assertEqual(leaf.get_section().slug, 'branch')
+        self.assertEqual(leaf.tree_path, '{}/{}/'.format(branch.pk, leaf.pk))
+
+    def test_search(self):
+        section = Article(slug='section', title='Haystack')
+        section.save()
+        Article(slug='in-body', title='First', parent=section,
+                body='<p>A <em>needle</em> in the body.</p>').save()
+        image = FileAsset(title='Image')
+        image.save()
+        Article(slug='in-title', title='Needle', parent=section,
+                image=image).save()
+        Article(slug='private', title='Needle', parent=section,
+                is_public=False).save()
+        Article(slug='elsewhere', title='Hay', parent=section).save()
+        for results in [Article.objects.search('needle'),
+                        search_index._search_rows(Article, ['needle'])]:
+            self.assertEqual([x.slug for x in results],
+                             ['in-title', 'in-body'])
+            # Results come with their images; templates show them.
+            with self.assertNumQueries(0):
+                self.assertEqual(results[0].image, image)
+        self.assertIn('<mark>needle</mark>', results[1].search_snippet)
+        # Sections are not search results and deleted articles are gone.
+        self.assertEqual(len(Article.objects.search('haystack')), 0)
+        Article.objects.get(slug='in-title').delete()
+        self.assertEqual(len(Article.objects.search('needle')), 1)
+
+    def test_keyset_pagination(self):
+        p = Article(slug='the-parent')
+        p.save()
+        for i in range(7):
+            Article(slug='child-{}'.format(i), title='Child {}'.format(i),
+                    weight=i % 3, parent=p).save()
+        for i in range(2):
+            Article(slug='untitled-{}'.format(i), parent=p).save()
+        for sort_key in ['pk', '-pk', 'weight', '-weight', '-date_edit',
+                         'title', '-title']:
+            field = sort_key.lstrip('-')
+            expected = list(Article.objects.filter(parent=p).order_by(
+                F(field).desc(nulls_last=True) if sort_key[0] == '-' else
+                F(field).asc(nulls_first=True),
+                sort_key[0] + 'pk' if sort_key[0] == '-' else 'pk'))
+            paginator = KeysetPaginator(p.get_children(), 3, sort_key)
+            pages = [paginator.page()]
+            while pages[-1].has_next():
+                pages.append(paginator.page(pages[-1].next_cursor))
+            self.assertEqual([x for page in pages for x in page], expected)
+            self.assertFalse(pages[0].has_previous())
+            # Walking back gives the same pages.
+            previous = paginator.page(pages[-1].previous_cursor)
+            self.assertEqual(list(previous), list(pages[-2]))
+        self.assertRaises(ValueError, paginator.page, 'not-a-cursor')
+
+    def test_get_previous_and_next(self):
+        p = Article(slug='the-parent')
+        p.save()
+        for i in range(5):
+            Article(slug='child-{}'.format(i), title='Child {}'.format(i),
+                    weight=i % 2, parent=p).save()
+        Article(slug='untitled', parent=p).save()
+        Article(slug='private', parent=p, is_public=False).save()
+        for sort_key in ['-pk', 'title', '-title', '-weight', 'weight']:
+            p.sort_children = sort_key
+            p.save()
+            siblings = list(p.get_children().order_by(
+                F(sort_key.lstrip('-')).desc(nulls_last=True)
+                if sort_key[0] == '-' else
+                F(sort_key).asc(nulls_first=True),
+                sort_key[0] + 'pk' if sort_key[0] == '-' else 'pk'))
+            for i, article in enumerate(siblings):
+                article.parent = p
+                with CaptureQueriesContext(connection) as queries:
+                    previous, next = article.get_previous_and_next()
+                # Nulls are looked for on their own, next to the other rows.
+                self.assertLessEqual(
+                    len(queries), 3 if 'title' in sort_key else 2)
+                self.assertEqual(previous, siblings[i - 1] if i else None)
+                self.assertEqual(next, siblings[i + 1]
+                                 if i < len(siblings) - 1 else None)
+        # Private articles still have public neighbours.
+        a = Article.objects.get(slug='private')
+        self.assertIsNotNone(a.get_previous_and_next()[0])
+
+    def test_make_nav_items(self):
+        section = Article(slug='section')
+        section.save()
+        parent = Article(slug='parent', parent=section)
+        parent.save()
+        for i in range(5):
+            Article(slug='item-{}'.format(i), title='Item {}'.format(i),
+                    parent=parent).save()
+        articles = list(Article.objects.filter(parent=parent).order_by('pk'))
+        url = reverse('s13cms:article', args=['section', 'item-0'])
+        h.nav_items.clear()
+        with self.assertNumQueries(0):
+            items = h.make_nav_items(articles, url)
+        self.assertEqual(len(items), 5)
+        self.assertEqual(items[0], '<a href="{}" class="active">'
+                         '<span>Item 0</span></a>'.format(url))
+        self.assertEqual(h.make_nav_items(articles, url), items)
+        self.assertEqual(h.nav_items.hits, 1)
+        articles[0].title = 'Changed'
+        articles[0].save()
+        self.assertIn('Changed', h.make_nav_items(articles, url)[0])
+
+    def test_url_path(self):
+        section = Article(slug='section')
+        section.save()
+        parent = Article(slug='parent', parent=section)
+        parent.save()
+        child = Article(slug='child', parent=parent)
+        child.save()
+        self.assertEqual(child.url_path, '/section/child/')
+        # Renaming the section moves the URLs of all its descendants.
+        section.slug = 'renamed'
+        section.save()
+        self.assertEqual(
+            list(Article.objects.order_by('pk').values_list(
+                'url_path', flat=True)),
+            ['/renamed/', '/renamed/parent/', '/renamed/child/']
+        )
+        # Deleting the parent makes the child a section.
+        parent.delete()
+        child.refresh_from_db()
+        self.assertEqual(child.make_url(), '/child/')
+        child.is_homepage = True
+        child.save()
+        self.assertEqual(child.url_path, reverse('s13cms:homepage'))
+
+    def test_get_article(self):
+        section = Article(slug='section')
+        section.save()
+        parent = Article(slug='parent', parent=section)
+        parent.save()
+        Article(slug='child', parent=parent).save()
+        Article(slug='other').save()
+        with self.assertNumQueries(1):
+            found, article = Article.objects.get_article('section', 'child')
+            self.assertEqual((found, article.slug), (section, 'child'))
+        with self.assertNumQueries(1):
+            self.assertEqual(Article.objects.get_article('other', 'child'),
+                             (None, None))
+        with override_settings(ARTICLE_SLUG_MAP=True):
+            self.assertEqual(
+                Article.objects.get_slug_map()['child'][:2],
+                (article.pk, 'section')
+            )
+            with self.assertNumQueries(0):
+                self.assertEqual(
+                    Article.objects.get_article('other', 'child'),
+                    (None, None)
+                )
+                self.assertEqual(
+                    Article.objects.get_article('section', 'nothing'),
+                    (None, None)
+                )
+            # Moving the article out of the section updates the map.
+            article.parent = Article.objects.get(slug='other')
+            article.save()
+            found, article = Article.objects.get_article('other', 'child')
+            self.assertEqual(found.slug, 'other')
+
+    @override_settings(RECENT_ARTICLES_COUNT=2)
+    def test_recent_articles(self):
+        homepage = Article(slug='homepage', is_homepage=True)
+        homepage.save()
+        Article(slug='welcome', parent=homepage).save()
+        section = Article(slug='section')
+        section.save()
+        articles = []
+        for i in range(12):
+            articles.append(Article(slug='article-{}'.format(i),
+                                    parent=section))
+            articles[-1].save()
+        recent.invalidate()
+        items = recent.get_articles(homepage)
+        self.assertEqual([x.pk for x in items],
+                         [articles[11].pk, articles[10].pk])
+        self.assertEqual(items[0].make_url(), '/section/article-11/')
+        # Saving updates the stored list without querying it again.
+        articles[11].is_public = False
+        articles[11].save()
+        articles[10].title = 'Changed'
+        articles[10].save()
+        with self.assertNumQueries(0):
+            items = recent.get_articles(homepage)
+        self.assertEqual([x.pk for x in items],
+                         [articles[10].pk, articles[9].pk])
+        self.assertEqual(items[0].title, 'Changed')
+        # Unpublishing more articles than were kept queries them again.
+        for article in articles[:11]:
+            article.is_public = False
+            article.save()
+        self.assertEqual(recent.get_articles(homepage), [])
+
+
+class ModelFileAssetTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root.name))
+
+    def test_file_info(self):
+        asset = FileAsset(title='Asset')
+        asset.media_file = SimpleUploadedFile('asset.TXT', b'first')
+        asset.save()
+        asset = FileAsset.objects.get(pk=asset.pk)
+        self.assertEqual(asset.extension, 'txt')
+        self.assertTrue(asset.file_exists)
+        self.assertEqual(asset.size_bytes, 5)
+        self.assertEqual(asset.sha256, hashlib.sha256(b'first').hexdigest())
+        self.assertIsNotNone(asset.verified_at)
+        # Listings read the stored values instead of the filesystem.
+        with open(asset.path_on_disk, 'wb') as f:
+            f.write(b'changed')
+        self.assertEqual(asset.size, 5)
+        call_command('s13verifyassets', workers=2, stdout=io.StringIO())
+        asset.refresh_from_db()
+        self.assertEqual(asset.size, 7)
+        self.assertEqual(asset.sha256, hashlib.sha256(b'changed').hexdigest())
+        os.remove(asset.path_on_disk)
+        call_command('s13verifyassets', stdout=io.StringIO())
+        asset.refresh_from_db()
+        self.assertFalse(asset.on_disk)
+        self.assertEqual((asset.size, asset.sha256), (0, ''))
+
+    def test_content_addressed_storage(self):
+        field = FileAsset._meta.get_field('media_file')
+        self.enterContext(
+            mock.patch.object(field, 'storage', ContentAddressedStorage()))
+        assets = []
+        for name in ['logo.PNG', 'logo-copy.png']:
+            asset = FileAsset(title='Logo')
+            asset.media_file = SimpleUploadedFile(name, b'logo')
+            asset.save()
+            assets.append(asset)
+        sha256 = hashlib.sha256(b'logo').hexdigest()
+        self.assertEqual(assets[0].media_file.name,
+                         'blobs/{}/{}.png'.format(sha256[:2], sha256))
+        self.assertEqual(assets[1].media_file.name, assets[0].media_file.name)
+        path = assets[0].path_on_disk
+        # The file is removed along with the last File Asset using it.
+        assets[0].delete()
+        self.assertTrue(os.path.isfile(path))
+        assets[1].media_file = SimpleUploadedFile('logo.png', b'new logo')
+        assets[1].save()
+        self.assertFalse(os.path.isfile(path))
+        assets[1].delete()
+        self.assertFalse(os.path.isfile(assets[1].path_on_disk))
+
+    def test_overwritten_file(self):
+        assets = []
+        for data in [b'first', b'second']:
+            asset = FileAsset(title='Logo')
+            asset.media_file = SimpleUploadedFile('logo.txt', data)
+            asset.save()
+            assets.append(asset)
+        # The second upload replaced the file of the first File Asset.
+        self.assertEqual(assets[1].media_file.name, 'logo.txt')
+        assets[0].refresh_from_db()
+        self.assertEqual((assets[0].size, assets[0].sha256),
+                         (6, hashlib.sha256(b'second').hexdigest()))
+
+    def test_convert_media(self):
+        assets = []
+        for name in ['report.pdf', 'report-final.pdf']:
+            asset = FileAsset(title='Report')
+            asset.media_file = SimpleUploadedFile(name, b'report')
+            asset.save()
+            assets.append(asset)
+        old_path = assets[0].path_on_disk
+        with self.assertRaises(CommandError):
+            call_command('s13convertmedia', stdout=io.StringIO())
+        with override_settings(CONTENT_ADDRESSED_MEDIA=True):
+            call_command('s13convertmedia', keep_links=True,
+                         stdout=io.StringIO())
+        for asset in assets:
+            asset.refresh_from_db()
+        self.assertTrue(assets[0].media_file.name.startswith('blobs/'))
+        self.assertEqual(assets[1].media_file.name, assets[0].media_file.name)
+        self.assertTrue(assets[0].on_disk)
+        self.assertTrue(os.path.islink(old_path))
+        with open(old_path, 'rb') as f:
+            self.assertEqual(f.read(), b'report')
+
+    @override_settings(UPLOAD_SIZE_LIMITS={'mp4': 16, '*': 1024})
+    def test_streaming_upload(self):
+        User.objects.create_user('uploader', 'up@example.com', 'password!')
+        c = Client(enforce_csrf_checks=True)
+        c.login(username='uploader', password='password!')
+        url = reverse('s13admin:create_fileasset')
+        response = c.post(url, {
+            'title': 'Clip',
+            'media_file': SimpleUploadedFile('clip.txt', b'clip')
+        })
+        self.assertEqual(response.status_code, 403)
+        c.get(url)
+        token = c.cookies['csrftoken'].value
+        responses = []
+        # The checksums of streamed uploads are computed only once.
+        with mock.patch.object(fileinfo, 'hash_file',
+                               wraps=fileinfo.hash_file) as hash_file:
+            for name in ['clip.mp4', 'notes.txt']:
+                responses.append(c.post(url, {
+                    'csrfmiddlewaretoken': token,
+                    'title': name,
+                    'media_file': SimpleUploadedFile(name, b'x' * 17)
+                }))
+        hash_file.assert_not_called()
+        self.assertIn('clip.mp4 is larger than',
+                      responses[0].content.decode())
+        # The video went over its limit; the notes did not.
+        asset = FileAsset.objects.get()
+        self.assertEqual(asset.title, 'notes.txt')
+        self.assertEqual(asset.sha256, hashlib.sha256(b'x' * 17).hexdigest())
+        self.assertEqual(os.listdir(s.MEDIA_ROOT), ['notes.txt'])
+
+    def test_renditions_fallback(self):
+        asset = FileAsset(title='Asset')
+        asset.media_file = SimpleUploadedFile('asset.txt', b'text')
+        asset.save()
+        self.assertEqual(asset.rendition_files, {})
+        self.assertEqual(asset.rendition('thumb'), asset.url)
+        self.assertEqual(asset.rendition('no-such-rendition'), asset.url)
+
+    def test_rendition_urls(self):
+        sha256 = hashlib.sha256(b'image').hexdigest()
+        with mock.patch.object(renditions, 'get_format', return_value='jpeg'):
+            name = renditions.get_name(sha256, renditions.RENDITIONS['thumb'])
+        self.assertEqual(name, 'renditions/{}/{}-320x320q80.jpg'.format(
+            sha256[:2], sha256[:32]))
+        # Only the renditions that were made are used, without looking for
+        # them on disk.
+        asset = FileAsset(media_file='image.png', sha256=sha256,
+                          rendition_files={'thumb': name})
+        with mock.patch('os.path.isfile') as isfile, \
+                mock.patch('os.stat') as stat:
+            self.assertEqual(asset.rendition('thumb'), s.MEDIA_URL + name)
+            self.assertEqual(asset.rendition('medium'), asset.url)
+        isfile.assert_not_called()
+        stat.assert_not_called()
+
+    @skipIf(renditions.Image is None, 'Pillow is not installed.')
+    def test_renditions(self):
+        data = io.BytesIO()
+        renditions.Image.new('RGBA', (800, 400), 'red').save(data, 'PNG')
+        assets = []
+        for i in range(2):
+            asset = FileAsset(title='Image')
+            asset.media_file = SimpleUploadedFile(
+                'image-{}.png'.format(i), data.getvalue())
+            asset.save()
+            assets.append(asset)
+        self.assertEqual(assets[0].rendition('thumb'), assets[0].url)
+        out = io.StringIO()
+        call_command('s13renditions', workers=2, stdout=out)
+        # Identical files share their renditions.
+        self.assertIn('Made {0} of {0}'.format(len(renditions.RENDITIONS)),
+                      out.getvalue())
+        for asset in assets:
+            asset.refresh_from_db()
+        url = assets[0].rendition('thumb')
+        self.assertEqual(assets[1].rendition('thumb'), url)
+        self.assertTrue(url.startswith(s.MEDIA_URL + 'renditions/'))
+        path = os.path.join(s.MEDIA_ROOT, url[len(s.MEDIA_URL):])
+        with renditions.Image.open(path) as image:
+            self.assertEqual(image.size, (320, 160))
+        # Renditions can be made when saving.
+        asset = FileAsset(title='Image')
+        asset.media_file = SimpleUploadedFile('new.png', data.getvalue())
+        with override_settings(RENDITIONS_EAGER=True):
+            asset.save()
+        self.assertEqual(asset.rendition('thumb'), url)
+        for asset in assets + [asset]:
+            self.assertTrue(os.path.isfile(path))
+            asset.delete()
+        self.assertFalse(os.path.isfile(path))
+
+
+class QueryBudgetTests(TestCase):
+    '''Runs the public views against small content and against deep and
+    wide content; each must stay within its query budget, and the number of
+    queries must not grow with the content.
+    '''
+    def setUp(self):
+        if User.objects.count() < 1:
+            User.objects.create_user(
+                'admin', 'admin@example.com', 'admin-password!'
+            )
+        if Setting.objects.count() < 1:
+            Setting(is_active=True).save()
+
+    def assertWithinQueryBudget(self, client, url):
+        '''Requests @url with nothing cached and fails if its view runs
+        more queries than its budget. Returns the number of queries.
+        '''
+        view_class = resolve(url.split('?')[0]).func.view_class
+        self.assertIsNotNone(querybudget.get_budget(view_class))
+        cache.clear()
+        with querybudget.count_queries() as counter:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        try:
+            querybudget.check(view_class, counter, url)
+        except querybudget.QueryBudgetExceeded as e:
+            self.fail(str(e))
+        return counter.count
+
+    def make_tree(self, depth, width):
+        '''Builds a homepage and a section with @width children, the first
+        of which has @depth generations of descendants; every other child has
+        an image. Returns the URLs of the pages to check.
+        '''
+        Article(slug='home', title='Home', is_homepage=True,
+                include_children=10).save()
+        section = Article(slug='section', title='Section', include_children=10)
+        section.save()
+        for i in range(width):
+            # Every other article has an image, which listings may show.
+            image = None
+            if i % 2:
+                image = FileAsset(title='Image {}'.format(i))
+                image.save()
+            Article(slug='wide-{}'.format(i), title='Wide {}'.format(i),
+                    body='{{ article.title }}', parent=section,
+                    image=image).save()
+        parent = Article.objects.get(slug='wide-0')
+        for i in range(depth):
+            parent = Article(slug='deep-{}'.format(i), title='Deep',
+                             parent=parent, include_children=5)
+            parent.save()
+        return [
+            reverse('s13cms:homepage'),
+            reverse('s13cms:section', args=['section']),
+            reverse('s13cms:article', args=['section', 'wide-0']),
+            reverse('s13cms:article', args=['section', 'wide-1']),
+            reverse('s13cms:article', args=['section', parent.slug]),
+            reverse('s13cms:keyword-search') + '?q=wide',
+            reverse('s13cms:sitemap'),
+        ]
+
+    def test_query_budgets(self):
+        for logged_in in [False, True]:
+            client = Client()
+            if logged_in:
+                client.login(username='admin', password='admin-password!')
+            counts = []
+            for depth, width in [(1, 2), (8, 40)]:
+                Article.objects.all().delete()
+                urls = self.make_tree(depth, width)
+                counts.append([
+                    self.assertWithinQueryBudget(client, x) for x in urls])
+            self.assertEqual(counts[0], counts[1])
+
+    @override_settings(DEBUG=True, QUERY_BUDGET_CHECKS=True)
+    def test_middleware(self):
+        self.make_tree(1, 2)
+        url = reverse('s13cms:article', args=['section', 'wide-0'])
+        self.assertEqual(Client().get(url).status_code, 200)
+        with mock.patch.object(ArticleView, 'query_budget', 1):
+            with self.assertLogs('django.request', 'ERROR'), \
+                    self.assertRaises(querybudget.QueryBudgetExceeded):
+                Client().get(url)
+            # The checks are off unless asked for.
+            with override_settings(QUERY_BUDGET_CHECKS=False):
+                self.assertEqual(Client().get(url).status_code, 200)
+
+
+class QueryPlanTests(TestCase):
+    '''Fails if a query that the views run on every request stops using an
+    index and reads the whole table instead.
+    '''
+    tables = ['content_management_article', 'content_management_fileasset']
+    # Scanning these indexes reads only the rows that the query selects.
+    partial_indexes = [
+        'article_children_edit',
+        'article_children_title',
+        'article_children_weight',
+        'article_homepage',
+        'article_public_edit',
+        'article_public_made',
+    ]
+
+    def setUp(self):
+        if User.objects.count() < 1:
+            User.objects.create_user(
+                'admin', 'admin@example.com', 'admin-password!'
+            )
+        self.section = Article(slug='section')
+        self.section.save()
+        self.article = Article(slug='article', parent=self.section)
+        self.article.save()
+
+    def get_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(str(x[-1]) for x in cursor.fetchall())
+
+    def assertNoTableScan(self, queryset):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite only.')
+        self.assertPlanHasNoTableScan(queryset.explain(), queryset.query)
+
+    def assertPlanHasNoTableScan(self, plan, query):
+        partial = '|'.join(self.partial_indexes)
+        for table in self.tables:
+            self.assertIsNone(re.search(
+                r'\bSCAN {}\b(?! USING (COVERING )?INDEX ({})\b)'.format(
+                    table, partial),
+                plan
+            ), '{}\n{}'.format(query, plan))
+
+    def test_article_manager(self):
+        self.assertNoTableScan(Article.objects.filter(
+            is_homepage=True, is_public=True))
+        self.assertNoTableScan(Article.objects.filter(
+            slug='section', parent=None))
+        self.assertNoTableScan(Article.objects.filter(parent=None)
+                               .order_by('-is_homepage', 'weight'))
+        self.assertNoTableScan(Article.objects.select_related('section')
+                               .filter(parent__isnull=False, slug='article'))
+
+    def test_article_relations(self):
+        for key, label in Article._meta.get_field('sort_children').choices:
+            self.section.sort_children = key
+            self.assertNoTableScan(self.section.get_children())
+            self.assertNoTableScan(self.article.get_siblings())
+        self.assertNoTableScan(self.section.get_progeny())
+        self.assertNoTableScan(self.article.get_media())
+        self.assertNoTableScan(
+            Article.objects.filter(pk__in=[self.section.pk]))
+
+    def test_neighbours(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite only.')
+        Article(slug='next', parent=self.section).save()
+        for key in ['title', '-title', 'weight', '-weight', 'date_edit']:
+            self.section.sort_children = key
+            self.article.parent = self.section
+            with CaptureQueriesContext(connection) as queries:
+                self.article.get_previous_and_next()
+            field = key.lstrip('-')
+            for query in queries:
+                plan = self.get_plan(query['sql'])
+                # The neighbour is sought from this article's sort value.
+                self.assertRegex(plan, r'\bparent_id=\? AND {}[<>=]'.format(
+                    field), query['sql'])
+
+    def test_keyset_cursor(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite only.')
+        for i in range(3):
+            Article(slug='child-{}'.format(i), parent=self.section).save()
+        for key in ['title', '-title', 'weight', '-weight', 'date_edit']:
+            paginator = KeysetPaginator(self.section.get_children(), 1, key)
+            cursor = paginator.page().next_cursor
+            with CaptureQueriesContext(connection) as queries:
+                paginator.page(cursor)
+            field = key.lstrip('-')
+            for query in queries:
+                plan = self.get_plan(query['sql'])
+                # The page is sought from the cursor's sort value.
+                self.assertRegex(plan, r'\bparent_id=\? AND {}[<>=]'.format(
+                    field), query['sql'])
+
+    def test_views(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite only.')
+        # The queries are captured from the views themselves, so that new
+        # ones are checked as soon as they are added.
+        Setting(is_active=True).save()
+        Article(slug='home', is_homepage=True, include_children=1).save()
+        self.section.include_children = 1
+        self.section.sort_children = 'weight'
+        self.section.save()
+        for i in range(3):
+            Article(slug='child-{}'.format(i), title='Child', weight=i,
+                    image=FileAsset.objects.create(title='Image'),
+                    parent=self.section).save()
+        cursor = KeysetPaginator(
+            self.section.get_children(), 1, 'weight').page().next_cursor
+        urls = [
+            reverse('s13cms:homepage'),
+            reverse('s13cms:section', args=['section']),
+            reverse('s13cms:section', args=['section']) + '?c=' + cursor,
+            reverse('s13cms:article', args=['section', 'child-1']),
+            reverse('s13cms:keyword-search') + '?q=child',
+            reverse('s13cms:sitemap'),
+        ]
+        with override_settings(KEYSET_PAGINATION=True):
+            for url in urls:
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(Client().get(url).status_code, 200)
+                selects = [x['sql'] for x in queries
+                           if x['sql'].startswith('SELECT')]
+                self.assertTrue(selects, url)
+                for sql in selects:
+                    self.assertPlanHasNoTableScan(self.get_plan(sql), sql)
+
+
+class Jinja2EnvironmentTests(TestCase):
+    def test_bytecode_cache(self):
+        # Leave the website's environment in place afterwards.
+        with tempfile.TemporaryDirectory() as d, \
+                mock.patch.multiple(jinja2env, _environment=None,
+                                    _string_environment=None):
+            cache_dir = os.path.join(d, 'cache')
+            env = jinja2env.environment(
+                loader=FileSystemLoader(s.TEMPLATES[0]['DIRS']),
+                bytecode_cache_dir=cache_dir
+            )
+            env.get_template('defaults/_base.html')
+            self.assertTrue(os.listdir(cache_dir))
+
+    def test_fragment_cache(self):
+        template = jinja2env.get_environment().from_string(
+            '{% cache "fragment" %}<b>{{ calls.append(1) or calls|length }}'
+            '</b>{% endcache %}'
+        )
+        calls = []
+        self.assertEqual(template.render(calls=calls), '<b>1</b>')
+        self.assertEqual(template.render(calls=calls), '<b>1</b>')
+        bump_version('content')
+        self.assertEqual(template.render(calls=calls), '<b>2</b>')
+
+    def test_compile_template(self):
+        template = compile_template('{{ h.static("a.css") }} <b>{{ x }}</b>')
+        self.assertEqual(template.render(), '/static/a.css <b></b>')
+
+
+class LRUCacheTests(TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)  # "b" is now the oldest.
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.stats['size'], 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+class TemplateChoicesTests(TestCase):
+    def test_registry_refresh(self):
+        with tempfile.TemporaryDirectory() as d:
+            templates = [dict(s.TEMPLATES[0], DIRS=[d])]
+            with override_settings(TEMPLATES=templates,
+                                   TEMPLATE_CHOICES_CHECK_INTERVAL=0):
+                h.invalidate_template_choices()
+                first = os.path.join(d, 'first.html')
+                second = os.path.join(d, 'second.html')
+                open(first, 'w').close()
+                self.assertTrue(h.is_template_choice(first))
+                self.assertFalse(h.is_template_choice(second))
+                # Adding a file changes the directory's modification time.
+                open(second, 'w').close()
+                os.utime(d, ns=(0, 0))
+                self.assertTrue(h.is_template_choice(second))
+            h.invalidate_template_choices()
+
+
+@override_settings(DASHBOARD_STATS_BACKGROUND=False)
+class StatsTests(TestCase):
+    def setUp(self):
+        if User.objects.count() < 1:
+            User.objects.create_user(
+                username='username', password='password', email='user@site.com'
+            )
+        cache.delete(stats.CACHE_KEY)
+        section = Article(slug='section', title='Section')
+        section.save()
+        parent = Article(slug='parent', parent=section)
+        parent.save()
+        Article(slug='child', parent=parent, is_public=False).save()
+
+    def test_snapshot(self):
+        snapshot = stats.get_stats()
+        self.assertEqual(
+            (snapshot['articles_count'], snapshot['articles_public'],
+             snapshot['articles_draft']),
+            (2, 1, 1)
+        )
+        self.assertEqual(snapshot['sections'][0]['num_descendants'], 2)
+        # The snapshot is kept until the content changes.
+        with self.assertNumQueries(0):
+            self.assertEqual(stats.get_stats()['computed_at'],
+                             snapshot['computed_at'])
+        Article(slug='another').save()
+        self.assertEqual(stats.get_stats()['sections_count'], 2)
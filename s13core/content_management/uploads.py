@@ -0,0 +1,108 @@
+'''An upload handler for File Assets that writes uploads straight into the
+storage's directory while computing their checksums, so that saving them is
+a rename instead of a copy.
+
+Sizes are limited per extension by UPLOAD_SIZE_LIMITS, a dictionary of
+extensions and sizes in bytes; the "*" key applies to the other extensions.
+Uploads are stopped as soon as they go over their limits, and the reasons are
+kept in request.upload_errors for the forms to show.
+'''
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.core.files.uploadhandler import SkipFile
+from django.core.files.uploadhandler import StopFutureHandlers
+
+from s13core.helpers import convert_bytes
+
+
+def get_size_limit(file_name):
+    '''Returns the size limit, in bytes, of uploads called @file_name; None
+    if there is none.
+    '''
+    limits = getattr(settings, 'UPLOAD_SIZE_LIMITS', {})
+    extension = os.path.splitext(file_name)[1].lower().lstrip('.')
+    return limits.get(extension, limits.get('*'))
+
+
+class StreamedUploadedFile(UploadedFile):
+    '''A file written by StreamingUploadHandler, whose sha256 is known. Like
+    TemporaryUploadedFile, the storage moves it into place; if it was not
+    moved, it is removed when closed.
+    '''
+    def __init__(self, path, name, content_type, charset,
+                 content_type_extra=None):
+        self.path = path
+        self.sha256 = None
+        file = open(path, 'wb+')
+        super().__init__(file, name, content_type, 0, charset,
+                         content_type_extra)
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    def __init__(self, request=None, storage=None):
+        super().__init__(request)
+        self.storage = storage
+        self.file = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = None
+        self.limit = get_size_limit(self.file_name)
+        if self.content_length is not None:
+            self.check_size(self.content_length)
+        # The file is written next to where it will be stored, on the same
+        # filesystem, so that it can be renamed into place.
+        directory = self.storage.path('')
+        os.makedirs(directory, exist_ok=True)
+        self.file = StreamedUploadedFile(
+            os.path.join(directory, '.upload-{}.tmp'.format(uuid.uuid4().hex)),
+            self.file_name, self.content_type, self.charset,
+            self.content_type_extra)
+        self.digest = hashlib.sha256()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.check_size(start + len(raw_data))
+        self.file.write(raw_data)
+        self.digest.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        return self.file
+
+    def check_size(self, size):
+        '''Skips the file if @size, in bytes, is over its limit.'''
+
+        if self.limit is None or size <= self.limit:
+            return
+        if self.file is not None:
+            self.file.close()
+        if self.request is not None:
+            if not hasattr(self.request, 'upload_errors'):
+                self.request.upload_errors = {}
+            self.request.upload_errors[self.field_name] = \
+                '{} is larger than {:.2f}MB.'.format(
+                    self.file_name, convert_bytes(self.limit, 'mb'))
+        raise SkipFile()
+
+    def upload_interrupted(self):
+        if self.file is not None:
+            self.file.close()
@@ -13,6 +13,11 @@ urlpatterns = [
         v.SitemapView.as_view(),
         name='sitemap'
     ),
+    path(
+        'sitemap/<int:page>/',
+        v.SitemapView.as_view(),
+        name='sitemap'
+    ),
     path(
         '<str:section_slug>/<str:article_slug>/',
         v.ArticleView.as_view(),
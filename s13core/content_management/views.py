@@ -1,13 +1,27 @@
+import hashlib
+import os
+
 from django.conf import settings as app_settings
 from django.core.paginator import Paginator
-from django.http import Http404, HttpResponse
+from django.db.models import Max
+from django.db.models import QuerySet
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render
+from django.template import loader
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.html import escape
+from django.utils.http import http_date
 from django.views.generic import TemplateView, View
 
 from s13core import helpers as h
+from s13core.caching import get_version
+from s13core.caching import get_version_date
 from s13core.settings.models import Setting
 
+from . import recent
 from .models import Article
+from .pagination import KeysetPaginator
 
 
 class S13CMSMixin:
@@ -15,9 +29,19 @@ class S13CMSMixin:
     articles = None
     article = None
     settings = None
+    validators = None
+    # The most queries a request may run, rendering included, however deep
+    # or wide the content is; see querybudget. Budgets assume the worst
+    # case: a logged-in user, and nothing cached yet, which costs two
+    # queries for the session and user and two for the settings.
+    query_budget = None
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # Templates may show article.body instead of article.rendered_body;
+        # other articles, like the sections, are rendered only on demand.
+        if self.article is not None:
+            self.article.pre_render()
         context['sections'] = self.sections
         context['articles'] = self.articles
         context['article'] = self.article
@@ -42,16 +66,28 @@ class S13CMSMixin:
         @selection and @num_pages are provided by the KeywordSearchView because
         that view is not really based on an article, so there is nothing to
         provide values for those arguments internally.
+
+        If settings.KEYSET_PAGINATION is True, QuerySets ordered by a single
+        field are paginated by keyset instead and a KeysetPage is returned;
+        pages after the first are then selected with a "?c=" cursor argument.
+        Links with "?p=" arguments keep working.
         '''
-        if not selection:
+        if selection is None:
             selection = self.article.get_children()
         if not num_pages:
             if self.article.include_children:
                 num_pages = self.article.include_children
             else:
                 return None
-        p = Paginator(selection, num_pages)
         page_num = self.get_page_number()
+        if page_num is None:
+            keyset_paginator = self.get_keyset_paginator(selection, num_pages)
+            if keyset_paginator:
+                try:
+                    return keyset_paginator.page(self.request.GET.get('c'))
+                except ValueError:
+                    return None
+        p = Paginator(selection, num_pages)
         if type(page_num) is int:
             if p.num_pages < page_num or page_num < 1:
                 return None
@@ -63,16 +99,103 @@ class S13CMSMixin:
             else:
                 return None
 
+    def get_keyset_paginator(self, selection, num_pages):
+        '''Returns a KeysetPaginator for the selection if keyset pagination is
+        enabled and possible; None otherwise.
+        '''
+        if not getattr(app_settings, 'KEYSET_PAGINATION', False):
+            return None
+        # Lists, like ranked search results, are already in memory.
+        if not isinstance(selection, QuerySet):
+            return None
+        ordering = selection.query.order_by
+        if len(ordering) != 1 or not isinstance(ordering[0], str):
+            return None
+        try:
+            return KeysetPaginator(selection, num_pages, ordering[0])
+        except ValueError:
+            return None
+
     def get_template(self):
         '''Ensures that the given template can be accessed for rendering.'''
 
-        templates = [x[0] for x in h.make_template_choices()]
         candidate = self.article.template
-        return candidate if candidate in templates else self.template_name
+        if candidate and h.is_template_choice(candidate):
+            return candidate
+        return self.template_name
+
+    def get_not_modified(self):
+        '''Computes validators for the current article without rendering
+        anything. Returns a 304 response if the client's copy, as described by
+        its If-None-Match or If-Modified-Since headers, is still current;
+        None otherwise.
+
+        Only anonymous requests are validated since logged-in users may see
+        private content and system messages.
+        '''
+        if self.request.user.is_authenticated:
+            return None
+        self.validators = self.get_validators()
+        response = get_conditional_response(
+            self.request,
+            etag=self.validators['etag'],
+            last_modified=self.validators['last_modified']
+        )
+        if response:
+            self.set_validators(response)
+        return response
+
+    def get_validators(self):
+        '''Returns a dictionary with an ETag and a Last-Modified timestamp
+        for the current article and request. These change whenever the
+        article, its children, the website settings, any other content that
+        may appear on the page, or the template file changes.
+        '''
+        dates = [
+            self.article.date_edit,
+            self.article.get_children().aggregate(
+                Max('date_edit'))['date_edit__max'],
+            get_version_date('settings'),
+            get_version_date('content'),
+        ]
+        template_mtime = 0
+        try:
+            origin = loader.get_template(self.template_name).origin.name
+            template_mtime = os.stat(origin).st_mtime
+        except Exception:
+            pass
+        last_modified = max(
+            [int(x.timestamp()) for x in dates if x] + [int(template_mtime)])
+        fingerprint = '\n'.join(str(x) for x in [
+            self.request.get_full_path(),
+            self.article.pk,
+            self.template_name,
+            template_mtime,
+            get_version('settings'),
+            get_version('content'),
+        ] + dates)
+        return {
+            'etag': '"{}"'.format(
+                hashlib.md5(fingerprint.encode('utf-8')).hexdigest()),
+            'last_modified': last_modified,
+        }
 
     def not_found(self, context):
         return render(self.request, 'defaults/_404.html', context, status=404)
 
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        self.set_validators(response)
+        return response
+
+    def set_validators(self, response):
+        '''Adds the validators computed by get_not_modified to a response.'''
+
+        if self.validators:
+            response.headers['ETag'] = self.validators['etag']
+            response.headers['Last-Modified'] = http_date(
+                self.validators['last_modified'])
+
     def tweak_settings(self, view_name):
         '''Modifies some settings values, taking into consideration the
         current view and article content.
@@ -112,13 +235,14 @@ class HomepageView(S13CMSMixin, TemplateView):
     has been assigned, a default page is rendered.
     '''
     template_name = 'defaults/homepage.html'
+    query_budget = 8
 
     def get(self, request, *args, **kwargs):
-        self.settings = Setting.objects.get(is_active=True)
-        self.sections = Article.objects.get_sections()
+        self.settings = Setting.objects.get_active()
         self.article = Article.objects.get_homepage()
         # No designated homepage:
         if self.article is None:
+            self.sections = Article.objects.get_sections()
             # If the site is set to display paginated contents when there
             # is no designated homepage, pull the contents from the database.
             if self.settings.nohome_content_type == 'articles':
@@ -134,16 +258,18 @@ class HomepageView(S13CMSMixin, TemplateView):
             self.template_name = 'defaults/no-homepage.html'
             return super().get(request, *args, **kwargs)
         # A homepage was designated:
+        self.template_name = self.get_template()
+        not_modified = self.get_not_modified()
+        if not_modified:
+            return not_modified
+        self.sections = Article.objects.get_sections()
         self.articles = self.paginate_children()
         self.tweak_settings(self.__class__.__name__)
-        self.template_name = self.get_template()
         return super().get(self.request, *self.args, **self.kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['latest_articles'] = Article.objects.filter(is_public=True)\
-            .exclude(parent=None).exclude(parent=self.article)\
-            .order_by('-date_made')[:32]
+        context['latest_articles'] = recent.get_articles(self.article)
         return context
 
 
@@ -151,22 +277,26 @@ class SectionView(S13CMSMixin, TemplateView):
     '''Responds with an Article that has no given parent.'''
 
     template_name = 'defaults/section.html'
+    query_budget = 8
 
     def get(self, request, *args, **kwargs):
-        self.settings = Setting.objects.get(is_active=True)
-        self.sections = Article.objects.get_sections()
+        self.settings = Setting.objects.get_active()
         self.article = Article.objects.get_section(kwargs['section_slug'])
         # The Section requested is invalid.
         if not self.article:
             return self.not_found({'s': self.settings})
         # Don't show private sections.
         if not self.article.is_public and not \
-                self.request.user.is_authenticated():
+                self.request.user.is_authenticated:
             return self.not_found({'s': self.settings})
         # The Section requested is valid.
+        self.template_name = self.get_template()
+        not_modified = self.get_not_modified()
+        if not_modified:
+            return not_modified
+        self.sections = Article.objects.get_sections()
         self.articles = self.paginate_children()
         self.tweak_settings(self.__class__.__name__)
-        self.template_name = self.get_template()
         return super().get(self.request, *self.args, **self.kwargs)
 
 
@@ -174,9 +304,10 @@ class KeywordSearchView(S13CMSMixin, TemplateView):
     '''Resonds with a Search Results page.'''
 
     template_name = 'defaults/keyword-search.html'
+    query_budget = 8
 
     def get(self, request, *args, **kwargs):
-        self.settings = Setting.objects.get(is_active=True)
+        self.settings = Setting.objects.get_active()
         self.sections = Article.objects.get_sections()
         self.article = Article(
             slug='keyword-search',
@@ -206,10 +337,10 @@ class ArticleView(S13CMSMixin, TemplateView):
     '''Responds with an Article that has a given parent.'''
 
     template_name = 'defaults/article.html'
+    query_budget = 9
 
     def get(self, request, *args, **kwargs):
-        self.settings = Setting.objects.get(is_active=True)
-        self.sections = Article.objects.get_sections()
+        self.settings = Setting.objects.get_active()
         self.section, self.article = Article.objects.get_article(
             kwargs['section_slug'], kwargs['article_slug']
         )
@@ -221,9 +352,13 @@ class ArticleView(S13CMSMixin, TemplateView):
             if not self.article.is_public or not self.section.is_public:
                 return self.not_found({'s': self.settings})
         # The requested Article is valid.
+        self.template_name = self.get_template()
+        not_modified = self.get_not_modified()
+        if not_modified:
+            return not_modified
+        self.sections = Article.objects.get_sections()
         self.articles = self.paginate_children()
         self.tweak_settings(self.__class__.__name__)
-        self.template_name = self.get_template()
         return super().get(self.request, *self.args, **self.kwargs)
 
     def get_context_data(self, **kwargs):
@@ -236,19 +371,90 @@ class ArticleView(S13CMSMixin, TemplateView):
 
 
 class SitemapView(View):
-    '''Generates a plain text sitemap for crawlers and search engines.'''
+    '''Generates an XML sitemap for crawlers and search engines. When there
+    are more public articles than fit in one sitemap (MAX_SITEMAP_LINKS),
+    responds with a sitemap index that points to numbered sitemaps instead.
+    '''
+    xmlns = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+    # Streaming one sitemap takes another query per 2000 articles.
+    query_budget = 4
 
-    max_results = getattr(app_settings, 'MAX_SITEMAP_LINKS', 50)
+    @property
+    def max_results(self):
+        return getattr(app_settings, 'MAX_SITEMAP_LINKS', 50000)
 
     def get(self, request, *args, **kwargs):
-        sitemap = []
-        for article in Article.objects.filter(
-                is_public=True).order_by('-pk')[:self.max_results]:
-            sitemap.append(request.build_absolute_uri(article.make_url()))
-        response = HttpResponse('\n'.join(sitemap))
-        response.headers['Content-Type'] = 'text/plain'
+        page = kwargs.get('page')
+        # Numbered sitemaps start at 1; /sitemap/ is the first one or the
+        # index.
+        if page is not None and page < 1:
+            raise Http404('Sitemap does not exist.')
+        selection = Article.objects.filter(is_public=True)
+        last_modified = selection.aggregate(Max('date_edit'))['date_edit__max']
+        etag = '"{}"'.format(hashlib.md5('{}\n{}\n{}'.format(
+            request.get_full_path(), last_modified, get_version('content')
+        ).encode('utf-8')).hexdigest())
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=int(last_modified.timestamp())
+            if last_modified else None
+        )
+        if response:
+            return response
+        num_pages = max(1, -(-selection.count() // self.max_results))
+        if page is None and num_pages > 1:
+            content = self.make_index(num_pages, last_modified)
+        elif (page or 1) <= num_pages:
+            start = ((page or 1) - 1) * self.max_results
+            content = self.make_urlset(
+                selection.order_by('pk')[start:start + self.max_results])
+        else:
+            raise Http404('Sitemap does not exist.')
+        response = StreamingHttpResponse(
+            content, content_type='application/xml; charset=utf-8')
+        response.headers['ETag'] = etag
+        if last_modified:
+            response.headers['Last-Modified'] = http_date(
+                last_modified.timestamp())
         return response
 
+    def make_index(self, num_pages, last_modified):
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<sitemapindex xmlns="{}">\n'.format(self.xmlns)
+        for page in range(1, num_pages + 1):
+            yield '<sitemap><loc>{}</loc>{}</sitemap>\n'.format(
+                escape(self.request.build_absolute_uri(
+                    reverse('s13cms:sitemap', args=[page]))),
+                self.make_lastmod(last_modified)
+            )
+        yield '</sitemapindex>\n'
+
+    def make_lastmod(self, date):
+        if not date:
+            return ''
+        return '<lastmod>{}</lastmod>'.format(date.isoformat())
+
+    def make_urlset(self, selection):
+        # Resolve every URL from one map of sections instead of walking each
+        # article's ancestry.
+        section_map = Article.objects.get_section_map()
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<urlset xmlns="{}">\n'.format(self.xmlns)
+        for article in selection.only(
+                'pk', 'slug', 'parent', 'tree_path', 'url_path',
+                'is_homepage', 'date_edit').iterator(chunk_size=2000):
+            # Leave out articles that are in private sections.
+            section = section_map.get(article.get_section_pk())
+            if section is not None and not section.is_public:
+                continue
+            yield '<url><loc>{}</loc>{}</url>\n'.format(
+                escape(self.request.build_absolute_uri(
+                    article.make_url(section_map))),
+                self.make_lastmod(article.date_edit)
+            )
+        yield '</urlset>\n'
+
 
 class UITestView(TemplateView):
     '''When settings.DEBUG is True, responds with a context-less template from
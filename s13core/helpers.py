@@ -4,10 +4,92 @@
 # jinja2env and used by the templates.
 import os
 import pytz
+import threading
+import time
 from markdown import markdown
 from django.conf import settings as s
 from django.utils import timezone
 
+from s13core.caching import LRUCache
+from s13core.caching import get_version
+
+
+class _TemplateRegistry:
+    '''Remembers the templates found by walking the template directories.
+    The walk is repeated only when the modification time of one of the
+    walked directories changes, which happens when files are added to,
+    removed from, or renamed in it. Directories are checked at most once
+    every TEMPLATE_CHOICES_CHECK_INTERVAL seconds.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.invalidate()
+
+    def get(self, extensions):
+        with self.lock:
+            if self.extensions != extensions or self._is_stale():
+                self._build(extensions)
+            return self.choices, self.names
+
+    def invalidate(self):
+        self.extensions = None
+        self.choices = []
+        self.names = frozenset()
+        self.mtimes = {}
+        self.checked = 0
+
+    def _build(self, extensions):
+        choices = []
+        mtimes = {}
+        prefix = os.path.join(s.BASE_DIR, 'templates') + os.sep
+        # Too deep, but what can we do?
+        for td in s.TEMPLATES:
+            for d in td['DIRS']:
+                for path, directories, files in os.walk(d):
+                    mtimes[path] = self._get_mtime(path)
+                    if not path.endswith('defaults') and not \
+                            path.endswith('admin') and not \
+                            path.endswith('admin/sidebars') and not \
+                            path.endswith('admin/forms') and not \
+                            path.endswith('testers'):
+                        for f in files:
+                            filename, file_extension = os.path.splitext(f)
+                            if file_extension in extensions and \
+                                    not f.startswith('_'):
+                                name = os.path.join(path, f)\
+                                    .replace(prefix, '')
+                                choices.append([name, name])
+                # Also watch configured directories that do not exist yet.
+                mtimes.setdefault(d, self._get_mtime(d))
+        self.extensions = extensions
+        self.choices = choices
+        self.names = frozenset(x[0] for x in choices)
+        self.mtimes = mtimes
+        self.checked = time.monotonic()
+
+    def _get_mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _is_stale(self):
+        now = time.monotonic()
+        interval = getattr(s, 'TEMPLATE_CHOICES_CHECK_INTERVAL', 5)
+        if now - self.checked < interval:
+            return False
+        self.checked = now
+        for path, mtime in self.mtimes.items():
+            if self._get_mtime(path) != mtime:
+                return True
+        return False
+
+
+_template_registry = _TemplateRegistry()
+
+# Navigation fragments made by make_nav_items, keyed on the content version.
+nav_items = LRUCache(getattr(s, 'NAV_ITEMS_CACHE_SIZE', 256))
+
 
 def convert_bytes(bytes, unit='kb'):
     '''Converts a given number of bytes into different unit values.
@@ -48,6 +130,23 @@ def get_now():
     return timezone.now()
 
 
+def invalidate_template_choices(touch=False):
+    '''Forgets the templates found so far so that the next lookup walks the
+    template directories again.
+
+    Arguments:
+        touch - if set to True, also update the modification times of the
+            template directories so that other processes refresh as well
+    '''
+    if touch:
+        for td in s.TEMPLATES:
+            for d in td['DIRS']:
+                if os.path.isdir(d):
+                    os.utime(d)
+    with _template_registry.lock:
+        _template_registry.invalidate()
+
+
 def is_current_section(current_article, section_slug):
     '''Evaluates the current article and determines whether it falls under
     the section with the given slug. Returns True or False.
@@ -59,6 +158,14 @@ def is_current_section(current_article, section_slug):
     return current_section.slug == section_slug
 
 
+def is_template_choice(name, more_extensions=[]):
+    '''Evaluates whether the given template name is one of the choices
+    offered by make_template_choices. Returns True or False.
+    '''
+    extensions = ('.html', '.xml', '.json', '.atom') + tuple(more_extensions)
+    return name in _template_registry.get(extensions)[1]
+
+
 def make_external_link(href, link_html, item_classes=None, item_id=None):
     '''Convenience function; creates an anchor with rel="noopener noreferrer"
     and target="_blank. Should be marked 'safe' in the template.".
@@ -75,35 +182,95 @@ def make_external_link(href, link_html, item_classes=None, item_id=None):
     return a.format(href, item_classes, item_id, link_html)
 
 
+def make_keyset_paginator_nav(
+        page, base_url, prev_text='Previous', next_text='Next',
+        nav_id=None, classes='', extra_args=''):
+    '''Returns a nav element with class "paginator-nav" containing previous
+    and next links that carry "?c=" cursors. Unlike make_paginator_nav, the
+    total number of pages is not shown because it is not known.
+
+    Arguments:
+        page - a KeysetPage instance
+        base_url - the URL where the GET parameter will be appended
+        prev_text - text value for the back/previous page link
+        next_text - text value for the next page link
+        nav_id - optional ID for the nav element to be created
+        classes - optional, additional classes for the nav element
+        extra_args - optional, additional URL parameters like &amp;q=terms
+    '''
+    nav = '<nav'
+    if nav_id:
+        nav += ' id="{}" '.format(nav_id)
+    nav += ' class="paginator-nav'
+    if classes:
+        nav += ' {}'.format(classes)
+    nav += '">'
+    if page.has_previous():
+        nav += '<a href="{}?c={}{}" rel="prev">{}</a>'.format(
+            base_url, page.previous_cursor, extra_args, prev_text)
+    else:
+        nav += '<span class="prev">{}</span>'.format(prev_text)
+    if page.has_next():
+        nav += '<a href="{}?c={}{}" rel="next">{}</a>'.format(
+            base_url, page.next_cursor, extra_args, next_text)
+    else:
+        nav += '<span class="next">{}</span>'.format(next_text)
+    nav += '</nav>\n'
+    return nav
+
+
 def make_nav_items(
             articles, current_url='/', classes='', use_slugs=False,
             include_private=False):
     '''Returns a list of navigation items as HTML anchors.
 
     Arguments:
-        articles - an iterable containing Article model instances
+        articles - an iterable, or QuerySet, containing Article instances
         current_url - serves as a comparison value for determining whether
             a generated link will have the "active" class
         classes - optional CSS classes for each link generated
         use_slugs - if set to True, render the article's slug instead of
             the title
+
+    Items without a stored URL path share a single section map, and the
+    resulting list is kept until an Article or FileAsset is changed.
     '''
+    articles = [x for x in articles if x.is_public or include_private]
+    if not articles:
+        return []
+    key = None
+    if all(x.pk for x in articles):
+        key = (
+            get_version('content'),
+            tuple(x.pk for x in articles),
+            current_url,
+            classes,
+            use_slugs,
+        )
+        items = nav_items.get(key)
+        if items is not None:
+            return list(items)
+    section_map = None
+    if any(x.parent_id is not None and not x.url_path for x in articles):
+        from s13core.content_management.models import Article
+        section_map = Article.objects.get_section_map()
     items = []
     for item in articles:
-        if item.is_public or (item.is_public == False and include_private):
-            item_url = item.make_url()
-            css_classes = ' class="{}{}{}"'.format(
-                'active' if item_url == current_url else '',
-                ' ' if item_url == current_url and classes else '',
-                classes
-            )
-            if css_classes == ' class=""':
-                css_classes = ''
-            link_text = item.slug if use_slugs else item.title
-            if item.is_homepage:
-                link_text = 'Home'
-            items.append('<a href="{}"{}><span>{}</span></a>'.format(
-                item_url, css_classes, link_text))
+        item_url = item.make_url(section_map)
+        css_classes = ' class="{}{}{}"'.format(
+            'active' if item_url == current_url else '',
+            ' ' if item_url == current_url and classes else '',
+            classes
+        )
+        if css_classes == ' class=""':
+            css_classes = ''
+        link_text = item.slug if use_slugs else item.title
+        if item.is_homepage:
+            link_text = 'Home'
+        items.append('<a href="{}"{}><span>{}</span></a>'.format(
+            item_url, css_classes, link_text))
+    if key is not None:
+        nav_items.set(key, tuple(items))
     return items
 
 
@@ -121,7 +288,12 @@ def make_paginator_nav(
         nav_id - optional ID for the nav element to be created
         classes - optional, additional classes for the nav element
         extra_args - optional, additional URL parameters like &amp;q=terms
+
+    Keyset pages are passed on to make_keyset_paginator_nav.
     '''
+    if getattr(page, 'is_keyset', False):
+        return make_keyset_paginator_nav(
+            page, base_url, prev_text, next_text, nav_id, classes, extra_args)
     nav = '<nav'
     if nav_id:
         nav += ' id="{}" '.format(nav_id)
@@ -170,25 +342,8 @@ def make_slug_from_date(date):
 def make_template_choices(more_extensions=[]):
     '''Generates a choices tuple for template fields in models.'''
 
-    extensions = ['.html', '.xml', '.json', '.atom'] + more_extensions
-    choices = []
-    prefix = os.path.join(s.BASE_DIR, 'templates') + os.sep
-    # Too deep, but what can we do?
-    for td in s.TEMPLATES:
-        for d in td['DIRS']:
-            for path, directories, files in os.walk(d):
-                if not path.endswith('defaults') and not \
-                        path.endswith('admin') and not \
-                        path.endswith('admin/sidebars') and not \
-                        path.endswith('admin/forms') and not \
-                        path.endswith('testers'):
-                    for f in files:
-                        filename, file_extension = os.path.splitext(f)
-                        if file_extension in extensions and \
-                                not f.startswith('_'):
-                            name = os.path.join(path, f).replace(prefix, '')
-                            choices.append([name, name])
-    return choices
+    extensions = ('.html', '.xml', '.json', '.atom') + tuple(more_extensions)
+    return [list(x) for x in _template_registry.get(extensions)[0]]
 
 
 def make_tabs(text, tabs=1):
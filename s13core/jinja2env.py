@@ -1,16 +1,144 @@
+import hashlib
+import os
+
+from django.conf import settings
 from django.contrib import messages
+from django.core.cache import caches
 from django.urls import reverse
 from jinja2 import Environment
+from jinja2 import FileSystemBytecodeCache
+from jinja2 import Template
+from jinja2 import Undefined
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
 
 import s13core.helpers as helpers
+from s13core.caching import LRUCache
+from s13core.caching import get_version
+from s13core.timing import timer
+
+
+# Compiled templates made from database content, like Article bodies, keyed
+# on a hash of their source.
+compiled_templates = LRUCache(
+    getattr(settings, 'BODY_TEMPLATE_CACHE_SIZE', 256)
+)
+
+# The environment made for the website's templates, and its overlay for
+# database content; see get_environment and get_string_environment.
+_environment = None
+_string_environment = None
+
+
+class FragmentCacheExtension(Extension):
+    '''Adds a cache tag that keeps the output of a part of a template in the
+    Django cache named by FRAGMENT_CACHE_ALIAS ('default' by default):
+
+        {% cache key, timeout, versions %}...{% endcache %}
+
+    The key may be any value with a stable repr, like a string or a list.
+    The timeout, in seconds, defaults to FRAGMENT_CACHE_TIMEOUT (300). The
+    version stamps named by @versions, a name or a list of names, are made
+    part of the key; by default, those of the content and the settings, so
+    that saving either expires the fragment.
+    '''
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        if len(args) > 3:
+            parser.fail('cache takes at most three arguments', lineno)
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache', args), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache(self, key, timeout=None, versions=('content', 'settings'),
+               caller=None):
+        if isinstance(versions, str):
+            versions = [versions]
+        key = 's13core:fragment:{}'.format(hashlib.md5(repr(
+            [key] + [get_version(x) for x in versions]
+        ).encode('utf-8')).hexdigest())
+        cache = caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+        value = cache.get(key)
+        if value is None:
+            value = str(caller())
+            if timeout is None:
+                timeout = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 300)
+            cache.set(key, value, timeout)
+        return Markup(value)
+
+
+class TimedTemplate(Template):
+    '''A Template whose rendering is timed for TimingMiddleware.'''
+
+    def render(self, *args, **kwargs):
+        with timer('template'):
+            return super().render(*args, **kwargs)
+
+
+def compile_template(source):
+    '''Returns a compiled Template for the given source string, reusing a
+    previously compiled one if the same source has been seen before.
+    '''
+    key = hashlib.sha256(source.encode('utf-8')).hexdigest()
+    return compiled_templates.get_or_set(
+        key, lambda: get_string_environment().from_string(source))
 
 
 def environment(**options):
+    '''Makes the Jinja2 environment for the website's templates. Besides the
+    usual Environment arguments, the OPTIONS of the template engine may hold:
+
+        bytecode_cache_dir - a directory where compiled templates are kept
+            between restarts; created if it does not exist
+    '''
+    global _environment, _string_environment
+    options['extensions'] = list(options.get('extensions', [])) + \
+        [FragmentCacheExtension]
+    bytecode_cache_dir = options.pop('bytecode_cache_dir', None)
+    if bytecode_cache_dir:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+        options['bytecode_cache'] = FileSystemBytecodeCache(
+            bytecode_cache_dir)
     env = Environment(**options)
+    env.template_class = TimedTemplate
     env.globals.update({
         'get_messages': messages.get_messages,
         'h': helpers,
         'reverse': reverse,
         'dir': dir
     })
+    _environment = env
+    _string_environment = None
     return env
+
+
+def get_environment():
+    '''Returns the environment of the website's templates, making the
+    template engines first if needed.
+    '''
+    if _environment is None:
+        from django.template import engines
+        engines.all()
+    if _environment is None:
+        # Jinja2 is not among the template engines; use the defaults.
+        environment()
+    return _environment
+
+
+def get_string_environment():
+    '''Returns an overlay of the website's environment for rendering database
+    content. It shares the globals but, like a plain Template, does not
+    escape its output and renders undefined values as empty strings.
+    '''
+    global _string_environment
+    if _string_environment is None:
+        _string_environment = get_environment().overlay(
+            autoescape=False, undefined=Undefined)
+    return _string_environment
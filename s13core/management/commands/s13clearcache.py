@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from s13core import helpers as h
+from s13core.caching import bump_version
+from s13core.jinja2env import get_environment
+
+
+class Command(BaseCommand):
+    help = 'Clears S13Core caches so that running website processes pick ' + \
+        'up changes made outside of the administration interface.'
+
+    def handle(self, *args, **options):
+        self.stdout.write('** Refreshing the list of available templates.')
+        # Touching the template directories makes every website process
+        # walk them again, not just this one.
+        h.invalidate_template_choices(touch=True)
+        bytecode_cache = get_environment().bytecode_cache
+        if bytecode_cache:
+            self.stdout.write('** Removing compiled templates.')
+            bytecode_cache.clear()
+        self.stdout.write('** Expiring cached content and settings.')
+        bump_version('content')
+        bump_version('settings')
+        self.stdout.write('** Caches cleared. Goodbye.')
@@ -0,0 +1,76 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from s13core import helpers as h
+from s13core.caching import bump_version
+from s13core.content_management import pagecache
+from s13core.content_management.fileinfo import read_file_info
+from s13core.content_management.models import FileAsset
+from s13core.content_management.storage import get_blob_name
+from s13core.content_management.storage import is_blob_name
+
+
+class Command(BaseCommand):
+    help = 'Moves the files of File Assets into content-addressed ' + \
+        'storage, keeping one copy of identical files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-links', action='store_true',
+            help='leave symbolic links to the moved files at their old ' +
+                 'names, so that links to them keep working'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='only show what would be done'
+        )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'CONTENT_ADDRESSED_MEDIA', False):
+            raise CommandError('Set CONTENT_ADDRESSED_MEDIA to True first.')
+        self.stdout.write('** Converting File Assets.')
+        converted = 0
+        missing = 0
+        saved = 0
+        seen = set()
+        names = FileAsset.objects.exclude(media_file='').exclude(
+            media_file=None).order_by('media_file').values_list(
+            'media_file', flat=True).distinct()
+        for name in list(names):
+            if is_blob_name(name):
+                continue
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            info = read_file_info(path)
+            if not info['file_exists']:
+                missing += 1
+                self.stdout.write('   Missing: {}'.format(name))
+                continue
+            new_name = get_blob_name(info['sha256'], name)
+            new_path = os.path.join(settings.MEDIA_ROOT, new_name)
+            self.stdout.write('   {} -> {}'.format(name, new_name))
+            converted += 1
+            if info['sha256'] in seen or os.path.isfile(new_path):
+                saved += info['size_bytes']
+            seen.add(info['sha256'])
+            if options['dry_run']:
+                continue
+            if os.path.isfile(new_path):
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                os.replace(path, new_path)
+            if options['keep_links']:
+                os.symlink(os.path.relpath(new_path, os.path.dirname(path)),
+                           path)
+            FileAsset.objects.filter(media_file=name).update(
+                media_file=new_name, verified_at=h.get_now(), **info)
+        if not options['dry_run']:
+            bump_version('content')
+            pagecache.invalidate_all()
+        self.stdout.write('   Converted {} file(s), {} missing; {} bytes of '
+                          'duplicates {}removed. Goodbye.'.format(
+                              converted, missing, saved,
+                              'would be ' if options['dry_run'] else ''))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from s13core.content_management.models import Article
+from s13core.content_management.search import search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of articles.'
+
+    def handle(self, *args, **options):
+        if not search_index.create():
+            self.stdout.write(
+                '** The database does not support the full-text search ' +
+                'index; searches will rank matching rows directly.')
+            return
+        self.stdout.write('** Rebuilding the search index.')
+        count = search_index.rebuild(Article.objects.iterator())
+        self.stdout.write('   Indexed {} article(s). Goodbye.'.format(count))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from s13core.caching import bump_version
+from s13core.content_management import pagecache
+from s13core.content_management import renditions
+from s13core.content_management.models import FileAsset
+
+
+class Command(BaseCommand):
+    help = 'Makes the renditions, like thumbnails, of image File Assets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='number of images to process at the same time; default ' +
+                 'is RENDITIONS_WORKERS or the number of processors'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='make renditions again, even those that exist'
+        )
+        parser.add_argument(
+            'names', nargs='*',
+            help='names of the renditions to make; default is all of them'
+        )
+
+    def handle(self, *args, **options):
+        if renditions.Image is None:
+            self.stdout.write('** Pillow is not installed. Goodbye.')
+            return
+        self.stdout.write('** Making renditions of File Assets.')
+        names = options['names'] or None
+        # Keyed on the destination so that File Assets with the same file
+        # share their renditions. Only the checks for existing renditions are
+        # done here; the images are processed by the worker processes.
+        jobs = {}
+        assets = list(FileAsset.objects.filter(
+            extension__in=renditions.IMAGE_EXTENSIONS).exclude(
+            sha256='').order_by('pk'))
+        for asset in assets:
+            for job in renditions.get_jobs(asset, names, options['force']):
+                jobs[job[1]] = job
+        made = renditions.make(list(jobs.values()), options['workers'])
+        for asset in assets:
+            asset.rendition_files = renditions.get_files(asset)
+        FileAsset.objects.bulk_update(
+            assets, ['rendition_files'], batch_size=500)
+        bump_version('content')
+        pagecache.invalidate_all()
+        self.stdout.write('   Made {} of {} rendition(s). Goodbye.'.format(
+            made, len(jobs)))
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from s13core import helpers as h
+from s13core.caching import bump_version
+from s13core.content_management.fileinfo import read_file_info
+from s13core.content_management.models import FileAsset
+
+
+FIELDS = ['file_exists', 'size_bytes', 'mtime', 'sha256', 'verified_at',
+          'rendition_files']
+
+
+class Command(BaseCommand):
+    help = 'Checks that the files of File Assets exist and stores their ' + \
+        'sizes and checksums.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='number of files to check at the same time; default is 8'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='hash every file, even those that seem unchanged'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='number of File Assets to check between database updates'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('** Verifying File Assets.')
+        checked = 0
+        missing = 0
+        # Reading files is left to the worker threads; the database is only
+        # used from this one.
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for batch in self.get_batches(options['batch_size']):
+                results = pool.map(
+                    lambda x: read_file_info(
+                        x.path_on_disk, x.size_bytes, x.mtime, x.sha256,
+                        options['force']),
+                    batch
+                )
+                now = h.get_now()
+                for asset, info in zip(batch, results):
+                    info['verified_at'] = now
+                    # The renditions of a changed file are made again.
+                    if info['sha256'] != asset.sha256:
+                        info['rendition_files'] = {}
+                    for field, value in info.items():
+                        setattr(asset, field, value)
+                    if not asset.file_exists:
+                        missing += 1
+                        self.stdout.write('   Missing: {}'.format(
+                            asset.media_file.name or asset.pk))
+                FileAsset.objects.bulk_update(batch, FIELDS)
+                checked += len(batch)
+        bump_version('content')
+        self.stdout.write('   Verified {} File Asset(s); {} missing. '
+                          'Goodbye.'.format(checked, missing))
+
+    def get_batches(self, batch_size):
+        pks = list(FileAsset.objects.order_by('pk')
+                   .values_list('pk', flat=True))
+        for i in range(0, len(pks), batch_size):
+            yield list(FileAsset.objects.filter(
+                pk__in=pks[i:i + batch_size]).order_by('pk'))
@@ -1,13 +1,54 @@
+import copy
+
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.signals import m2m_changed
 
-from jinja2 import Template
 
 import s13core
 from s13core import helpers as h
+from s13core.caching import LRUCache
+from s13core.caching import bump_version
+from s13core.caching import get_version
+from s13core.jinja2env import compile_template
+
+
+# Holds the active Setting loaded for the current settings version.
+_active_settings = LRUCache(1)
+
+
+class SettingManager(models.Manager):
+    def get_active(self):
+        '''Returns the active Setting together with its copyright, contact,
+        and disclaimer information. The Setting is loaded from the database
+        only when the settings version has changed since the last call. Each
+        call returns its own copy whose fields the caller may modify; related
+        objects are shared and must be left alone.
+        '''
+        setting = _active_settings.get_or_set(
+            get_version('settings'),
+            lambda: self.select_related('copyright', 'disclaimer')
+                        .prefetch_related('contact').get(is_active=True)
+        )
+        return copy.copy(setting)
 
 
-class Setting(models.Model):
+class SettingsVersionMixin:
+    '''Bumps the settings version whenever an object is saved or deleted.'''
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_version('settings')
+        return result
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        bump_version('settings')
+
+
+class Setting(SettingsVersionMixin, models.Model):
+    objects = SettingManager()
+
     # Basic Settings
     is_active = models.BooleanField(default=False)
     name = models.CharField(
@@ -146,7 +187,7 @@ class Setting(models.Model):
         ordering = ['-is_active', 'title']
 
 
-class ContactInfo(models.Model):
+class ContactInfo(SettingsVersionMixin, models.Model):
     contact_name = models.CharField(max_length=255, default='Juan de la Cruz')
     address = models.TextField(
         null=True, blank=True, help_text='Physical address. HTML allowed.')
@@ -165,11 +206,12 @@ class ContactInfo(models.Model):
 
     @property
     def address_html(self):
+        # Leave self.address alone; the object may be shared between
+        # requests through Setting.objects.get_active().
         if self.address:
-            self.address = Template(self.address).render(s13=s13core)
+            return compile_template(self.address).render(s13=s13core)
         else:
-            self.address = ''
-        return self.address
+            return ''
 
     class Meta:
         ordering = ['weight', 'contact_name']
@@ -177,7 +219,7 @@ class ContactInfo(models.Model):
         verbose_name_plural = 'Contact Information'
 
 
-class CopyrightInfo(models.Model):
+class CopyrightInfo(SettingsVersionMixin, models.Model):
     statement = models.CharField(
         max_length=255,
         default='',
@@ -223,7 +265,7 @@ class CopyrightInfo(models.Model):
         verbose_name_plural = 'Copyright Information'
 
 
-class Disclaimer(models.Model):
+class Disclaimer(SettingsVersionMixin, models.Model):
     title = models.CharField(max_length=255, default='Disclaimer')
     body = models.TextField(help_text='HTML allowed.', default='')
 
@@ -232,3 +274,10 @@ class Disclaimer(models.Model):
 
     class Meta:
         ordering = ['title']
+
+
+def bump_settings_version(sender, **kwargs):
+    bump_version('settings')
+
+
+m2m_changed.connect(bump_settings_version, sender=Setting.contact.through)
@@ -2,6 +2,7 @@ from django.core.exceptions import ValidationError
 from django.db import IntegrityError
 from django.test import TestCase
 
+from .models import CopyrightInfo
 from .models import Setting
 
 
@@ -24,3 +25,21 @@ class SettingsTests(TestCase):
         Setting(name='Settings Name', is_active=True).save()
         s = Setting(name='Settings Name')
         self.assertRaises(IntegrityError, s.save)
+
+    def test_get_active_is_cached(self):
+        copyright = CopyrightInfo(statement='Old statement.')
+        copyright.save()
+        Setting(name='Settings', is_active=True, copyright=copyright).save()
+        s = Setting.objects.get_active()
+        with self.assertNumQueries(0):
+            s = Setting.objects.get_active()
+            self.assertEqual(s.copyright.statement, 'Old statement.')
+            self.assertEqual(len(s.contact.all()), 0)
+            # Each caller gets its own copy.
+            s.title = 'Changed for this request only'
+            self.assertNotEqual(Setting.objects.get_active().title, s.title)
+        # Saving related information makes the next call reload.
+        copyright.statement = 'New statement.'
+        copyright.save()
+        s = Setting.objects.get_active()
+        self.assertEqual(s.copyright.statement, 'New statement.')
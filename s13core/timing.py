@@ -0,0 +1,79 @@
+'''Timers for the parts of a request, like database queries and template
+rendering, read by content_management.middleware.TimingMiddleware.
+
+Timers only run while the middleware is recording the current request; at
+other times, timer() costs a context variable lookup.
+'''
+import contextvars
+import time
+from contextlib import contextmanager
+
+
+_current = contextvars.ContextVar('s13core_timings', default=None)
+
+
+class RequestTimings:
+    '''Accumulated durations, in seconds, and counts of named timers.'''
+
+    def __init__(self):
+        self.counts = {}
+        self.durations = {}
+        self.depths = {}
+        self.started = time.perf_counter()
+
+    def add(self, name, seconds):
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.durations[name] = self.durations.get(name, 0) + seconds
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class QueryTimer:
+    '''A database execute wrapper that times queries; see
+    connection.execute_wrapper.
+    '''
+    def __init__(self, timings):
+        self.timings = timings
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.timings.add('db', time.perf_counter() - start)
+
+
+def start():
+    '''Starts recording timers for the current context. Returns the new
+    RequestTimings and a token for stop().
+    '''
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def stop(token):
+    '''Stops the recording started by start().'''
+
+    _current.reset(token)
+
+
+@contextmanager
+def timer(name):
+    '''Times the enclosed block under @name if a request is being recorded.
+    Nested blocks with the same name are counted once.
+    '''
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    depth = timings.depths.get(name, 0)
+    timings.depths[name] = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.depths[name] = depth
+        if not depth:
+            timings.add(name, time.perf_counter() - start)
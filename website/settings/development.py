@@ -23,17 +23,27 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    's13core.content_management.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    's13core.content_management.middleware.PageCacheMiddleware',
+    's13core.content_management.middleware.QueryBudgetMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'website.urls'
 
+# Fail requests whose views run more queries than their budgets; see
+# QueryBudgetMiddleware.
+QUERY_BUDGET_CHECKS = True
+
+# Share of requests measured by TimingMiddleware, from 0 to 1.
+REQUEST_TIMING_SAMPLE_RATE = 1
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.jinja2.Jinja2',
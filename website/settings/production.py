@@ -23,17 +23,22 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    's13core.content_management.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    's13core.content_management.middleware.PageCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'website.urls'
 
+# Share of requests measured by TimingMiddleware, from 0 to 1.
+REQUEST_TIMING_SAMPLE_RATE = 0
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.jinja2.Jinja2',
@@ -41,6 +46,11 @@ TEMPLATES = [
         'APP_DIRS': True,
         'OPTIONS': {
             'environment': 's13core.jinja2env.environment',
+            # Keep compiled templates between restarts and do not check
+            # template files for changes.
+            'bytecode_cache_dir': os.path.join(BASE_DIR, 'jinja2-cache'),
+            'auto_reload': False,
+            'cache_size': 1000,
         },
     },
 ]